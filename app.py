@@ -1,12 +1,15 @@
-from flask import Flask, request, render_template, session, redirect, jsonify
-import time
-import datetime
+from flask import Flask, request, render_template, session, redirect, jsonify, g
+import asyncio
 import src.spotify as spot
 import src.dataset_functions as dataset
 from threading import Thread
 from src.config import app_secret_key
+from src.instrument import profiler
+from src.tokens import tokens, TokenMissing
+from src.follows import follows
 
 import os
+import logging
 
 
 
@@ -14,12 +17,70 @@ app =Flask(__name__, static_url_path="", static_folder="static")
 
 app.secret_key = app_secret_key
 
+logging.basicConfig(level = logging.INFO)
 
-def background_video(headers):
+
+@app.before_request
+def start_query_profile():
+    '''
+    Starts counting database queries of request and binds them to user of session, for read your writes
+    '''
+
+    g.profile_token = profiler.start(request.path)
+    g.writer_token = dataset.mysql.bind_writer(tokens.user(session.get('token_key'))) #reads of user see its writes from any thread
+
+
+@app.teardown_request
+def finish_query_profile(exception):
+    '''
+    Logs summary of database queries of request
+    '''
+
+    token = g.pop('profile_token', None)
+    if token is not None:
+        profiler.finish(token)
+
+    token = g.pop('writer_token', None)
+    if token is not None:
+        dataset.mysql.unbind_writer(token)
+
+
+@app.errorhandler(TokenMissing)
+def token_missing(error):
+    '''
+    Tokens of user not found, e.g. after a restart or expired. Back to landing page to log in again
+    '''
+
+    session['token_key'] = None
+
+    return redirect('/', code=302)
+
+
+@app.errorhandler(spot.PlaylistIncomplete)
+def playlist_incomplete(error):
+    '''
+    Spotify did not take all songs of party playlist. Reported instead of showing a shorter playlist as done
+    '''
+
+    logging.warning(str(error))
+
+    return f"Playlist could not be completed, {error.added} of {error.total} songs were added. Please try again", 502
+
+
+@app.teardown_appcontext
+def release_db_connections(exception):
+    '''
+    Returns database connections of request thread to pool
+    '''
+
+    dataset.mysql.release()
+
+
+def background_video(token_key):
     '''
     Starts in the background a new thread making the mixtape video of top songs
     Args:
-        headers(dict): headers for spotify api
+        token_key(str): key of user tokens, headers are taken when needed so they do not expire while rendering
     
     '''
     
@@ -27,7 +88,14 @@ def background_video(headers):
 
     print('Video is being generated in the background')
 
-    mytop_list = dataset.get_my_top(headers) #gets list of top songs ids
+    dataset.mysql.bind_writer(tokens.user(token_key)) #same user as request starting it
+
+    try:
+        with profiler.profile('background_video'):
+            mytop_list = dataset.get_my_top(tokens.headers(token_key)) #gets list of top songs ids
+    finally:
+        dataset.mysql.release() #thread ends, connection back to pool
+        tokens.release(token_key) #held by request starting thread
 
     myvideo = dataset.create_video(mytop_list) #creates mixtape video
 
@@ -46,11 +114,9 @@ def index():
     Landing page endpoint
     '''
 
-    #initialization of session variables
-    session['access_token'] = None
-    session['access_token_expires'] = datetime.datetime.now()
-    session['refresh_token'] = None
-    session['access_token_did_expire'] = True
+    #initialization of session variables. Session is ended, tokens of user are kept while other sessions or background jobs use them
+    tokens.forget(session.get('token_key'))
+    session['token_key'] = None
 
     return render_template('index.html')
 
@@ -77,11 +143,9 @@ def callback():
     answer = spot.get_first_token(code) #this returns info with access token
 
  
-    #saving of spotify access token
-    session['access_token'] = answer[0]
-    session['access_token_expires'] = answer[2]
-    session['refresh_token'] = answer[1]
-    session['access_token_did_expire'] = answer[3]
+    #saving of spotify access token server side by user id, session only keeps a random key mapped to it
+    user_id = spot.get_my_user_info({"Authorization": f"Bearer {answer[0]}"})['id']
+    session['token_key'] = tokens.register(user_id, answer[0], answer[1], answer[2])
 
     return render_template('loading.html') #this html redirects automatically to endpoint /intro
 
@@ -99,12 +163,13 @@ def intro():
 
     
     #update of headers for spotify api
-    headers, access_token, access_token_expires = spot.get_resource_header(session['access_token'], session['access_token_expires'], session['refresh_token'])
+    headers = tokens.headers(session.get('token_key'))
     
     
 
-    #background  thread to start creating the top50 video
-    thread = Thread(target=background_video, args=(headers,))
+    #background  thread to start creating the top50 video. Tokens held until it ends
+    tokens.hold(session['token_key'])
+    thread = Thread(target=background_video, args=(session['token_key'],))
     thread.daemon = True
 
     thread.start()
@@ -113,10 +178,6 @@ def intro():
     #####################################################################
 
 
-    session['access_token'] = access_token
-    session['access_token_expires'] = access_token_expires
-
-    
     user_profile, user_top_songs = dataset.update_user_profile_data(headers)
 
     user_name = user_profile.get('name')
@@ -133,26 +194,18 @@ def intro():
     session['other_user'] = {'list_others': other_users}
 
 
-    ######## Camela distance  #######
-
-    avg_distance, min_distance, path_distance, ref_artist = dataset.get_info_distances_artist_ref(user_id)
-    ##### Popularity ########################
+    ######## Camela distance, popularity, musical age, genres and matches  #######
 
-    avg_popularity = dataset.get_rating_popu_user(user_id)
-
-    #### Musical Age ############################
-    avg_age = dataset.get_years_user(user_id)
+    stats, matches = asyncio.run(dataset.gather_intro_data(user_id)) #stats materialized at ingestion, matches calculated meanwhile
 
     
-    session['ref_artist'] = ref_artist
-
-    genre_list, values_list = dataset.genre_profile_api(user_id)
+    session['ref_artist'] = stats['ref_artist']
 
     
-    session['main_user'] = {'user_id': user_id, 'name': user_name, 'img_url': user_img, 'avg_dis': avg_distance, 'min_dis': min_distance, 'path_dis': path_distance, 'avg_popu': avg_popularity, 'avg_age': avg_age, 'values_chart': values_list }
-    session['chart_labels'] = genre_list
+    session['main_user'] = {'user_id': user_id, 'name': user_name, 'img_url': user_img, 'avg_dis': stats['avg_dis'], 'min_dis': stats['min_dis'], 'path_dis': stats['path_dis'], 'avg_popu': stats['avg_popu'], 'avg_age': stats['avg_age'], 'values_chart': stats['values_chart'] }
+    session['chart_labels'] = stats['genre_list']
 
-    session['matches_info'] = dataset.get_my_matches(session['main_user'].get('user_id'))
+    session['matches_info'] = matches
 
 
     print('Scraping of user info completed')
@@ -171,7 +224,8 @@ def stats():
 
     user_id = session['main_user'].get('user_id')
 
-    genre_list, values_list = dataset.genre_profile_api(user_id)
+    stats = dataset.get_user_stats(user_id)
+    genre_list, values_list = stats['genre_list'], stats['values_chart']
 
 
 
@@ -184,16 +238,18 @@ def user_stats(user_id):
 
     user_profile = dataset.get_full_info_user(user_id)
 
-    avg_popularity = dataset.get_rating_popu_user(user_id)
+    stats = dataset.get_user_stats(user_id)
+
+    avg_popularity = stats['avg_popu']
 
     avg_distance, min_distance, path_distance = dataset.get_info_distances_between_users(main_user, user_id)
 
-    path_distance = list(map(dataset.extract_url_img_by_artist_name, path_distance))
+    path_distance = list(map(dataset.extract_url_img_by_artist_id, path_distance))
 
-    avg_age = dataset.get_years_user(user_id)
+    avg_age = stats['avg_age']
 
 
-    genre_list, values_list = dataset.genre_profile_api(user_id)
+    genre_list, values_list = stats['genre_list'], stats['values_chart']
 
 
     user_profile['avg_dis']= avg_distance
@@ -210,11 +266,9 @@ def user_stats(user_id):
 
     user_profile['score']= match_score
 
-    headers, access_token, access_token_expires = spot.get_resource_header(session['access_token'], session['access_token_expires'], session['refresh_token'])
+    headers = tokens.headers(session.get('token_key'))
 
-    following = spot.check_follow(headers, user_id)[0]
-
-    print(following)
+    following = follows.is_following(headers, main_user, user_id)
 
 
 
@@ -227,7 +281,7 @@ def user_stats(user_id):
 @app.route('/select_members')
 def select_members():
 
-    headers, access_token, access_token_expires = spot.get_resource_header(session['access_token'], session['access_token_expires'], session['refresh_token'])
+    headers = tokens.headers(session.get('token_key'))
 
     main_user_id = session.get('main_user').get('user_id')
 
@@ -240,7 +294,7 @@ def select_members():
 @app.route('/party', methods = ['POST'])
 def party():
 
-    headers, access_token, access_token_expires = spot.get_resource_header(session['access_token'], session['access_token_expires'], session['refresh_token'])
+    headers = tokens.headers(session.get('token_key'))
 
     main_user_id = session.get('main_user').get('user_id')
 
@@ -248,8 +302,6 @@ def party():
 
     members.insert(0, main_user_id)
 
-    headers, access_token, access_token_expires = spot.get_resource_header(session['access_token'], session['access_token_expires'], session['refresh_token'])
-    
 
 
     song_id_list, url_playlist, stats_playlist = dataset.create_mix_playlist(headers, members)
@@ -265,18 +317,24 @@ def show_matches():
 
 
     other_users_info = session['matches_info']
+
+    headers = tokens.headers(session.get('token_key'))
+
+    main_user = session['main_user'].get('user_id')
+
+    following = follows.statuses(headers, main_user, [item['user_id'] for item in other_users_info]) #one request per 50 users
     
 
-    return render_template('matches.html', other_users_info = enumerate(other_users_info))
+    return render_template('matches.html', other_users_info = enumerate(other_users_info), following = following)
 
 
 @app.route('/follow_user/<user_id>')
 def follow_user(user_id):
 
 
-    headers, access_token, access_token_expires = spot.get_resource_header(session['access_token'], session['access_token_expires'], session['refresh_token'])
+    headers = tokens.headers(session.get('token_key'))
 
-    spot.follow_user(headers, user_id)
+    follows.follow(headers, session['main_user'].get('user_id'), user_id)
 
 
 
@@ -286,9 +344,9 @@ def follow_user(user_id):
 def unfollow_user(user_id):
 
 
-    headers, access_token, access_token_expires = spot.get_resource_header(session['access_token'], session['access_token_expires'], session['refresh_token'])
+    headers = tokens.headers(session.get('token_key'))
 
-    spot.unfollow_user(headers, user_id)
+    follows.unfollow(headers, session['main_user'].get('user_id'), user_id)
 
 
 
@@ -298,7 +356,7 @@ def unfollow_user(user_id):
 @app.route('/trending')
 def trending_songs():
 
-    headers, access_token, access_token_expires = spot.get_resource_header(session['access_token'], session['access_token_expires'], session['refresh_token'])
+    headers = tokens.headers(session.get('token_key'))
     
     info_trending = dataset.get_my_trending(headers)
 
@@ -340,6 +398,25 @@ def get_profile_api(user_id):
     return jsonify(dataset.genre_profile_api(user_id))
 
 
+@app.route('/cache_stats')
+def cache_stats():
+    '''
+    Hit rate statistics of database query cache
+    '''
+
+    return jsonify(dataset.mysql.cache.stats())
+
+
+@app.route('/metrics')
+def metrics():
+    '''
+    Query count, time, slowest statements and N+1 patterns of last requests and jobs
+    '''
+
+    return jsonify({'requests': profiler.summaries(), 'cache': dataset.mysql.cache.stats(), 'replicas': dataset.mysql.check_replicas(), 'spotify': spot.client.stats(), 'spotify_rate_limit': spot.client.limiter.stats(),
+                    'spotify_cache': spot.client.cache.stats() if spot.client.cache is not None else None, 'tokens': tokens.stats(), 'follows': follows.stats(), 'community': dataset.net.community.stats()})
+
+
 
 
 
@@ -0,0 +1,130 @@
+'''
+Compares artist community as ArtistGraph (ids interned, CSR arrays) and as networkx graph keyed by artist.
+
+    python benchmarks/artist_graph.py                               # 10k, 100k and 1M artists
+    python benchmarks/artist_graph.py --sizes 10000 50000 --related 20
+
+Synthetic graphs: every artist is related to --related artists, popular artists (low indices) more often.
+networkx is skipped above --nx-max artists, it needs several GB at 1M artists.
+'''
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.artist_graph import ArtistGraph
+
+
+
+def synthetic_edges(size, related, seed = 0):
+    '''
+    Returns ids and edges as index arrays
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    ids = [f'artist{i:016d}' for i in range(size)]
+    source = np.repeat(np.arange(size), related)
+    target = (size * rng.random(size * related) ** 2).astype(np.int64) #skewed to popular artists
+
+    return ids, source, target
+
+
+def measure(func):
+    '''
+    Returns result, seconds and peak MB allocated while running func
+    '''
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    result = func()
+
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def timeit(func, repeat):
+
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - start) / repeat * 1000 #ms per call
+
+
+def run_csr(ids, source, target, sources, users, repeat):
+
+    G, build_s, build_mb = measure(lambda: ArtistGraph.from_arrays(ids, ids, source, target))
+
+    def matches(i):
+        matrix = np.stack([G.bfs(item)[0] for item in sources]) #one BFS per artist of main user, all users answered from it
+        return [matrix[:, targets].mean() for targets in users]
+
+    return {'build_s': build_s, 'build_mb': build_mb,
+            'bfs_ms': timeit(lambda i: G.bfs(sources[i % len(sources)]), repeat),
+            'path_ms': timeit(lambda i: G.shortest_path(sources[i % len(sources)], users[0][i % len(users[0])]), repeat),
+            'matches_ms': timeit(matches, 1)}
+
+
+def run_networkx(ids, source, target, sources, users, repeat):
+
+    def build():
+        G = nx.Graph()
+        G.add_edges_from((ids[a], ids[b]) for a, b in zip(source, target) if a != b)
+        return G
+
+    G, build_s, build_mb = measure(build)
+
+    def matches(i):
+        #previous implementation: one search per pair of artists, for every user
+        return [np.mean([nx.shortest_path_length(G, ids[a], ids[b]) if nx.has_path(G, ids[a], ids[b]) else 15 for a in sources for b in targets]) for targets in users]
+
+    return {'build_s': build_s, 'build_mb': build_mb,
+            'bfs_ms': timeit(lambda i: nx.single_source_shortest_path_length(G, ids[sources[i % len(sources)]]), repeat),
+            'path_ms': timeit(lambda i: nx.shortest_path(G, ids[sources[i % len(sources)]], ids[users[0][i % len(users[0])]]), repeat),
+            'matches_ms': timeit(matches, 1)}
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [10000, 100000, 1000000], help = 'number of artists')
+    parser.add_argument('--related', type = int, default = 10, help = 'related artists per artist')
+    parser.add_argument('--nx-max', type = int, default = 100000, help = 'largest graph built with networkx')
+    parser.add_argument('--users', type = int, default = 20, help = 'other users compared with main user, 20 top artists each')
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    print(f"{'artists':>9} {'engine':>9} {'build s':>9} {'build MB':>9} {'bfs ms':>9} {'path ms':>9} {'matches ms':>11}")
+
+    for size in args.sizes:
+
+        ids, source, target = synthetic_edges(size, args.related)
+
+        rng = np.random.default_rng(1)
+        sources = [int(item) for item in rng.choice(size, 20, replace = False)] #top artists of main user
+        users = [[int(item) for item in rng.choice(size, 20, replace = False)] for user in range(args.users)]
+
+        engines = [('csr', run_csr)] + ([('networkx', run_networkx)] if size <= args.nx_max else [])
+
+        for name, func in engines:
+            result = func(ids, source, target, sources, users, args.repeat)
+            print(f"{size:>9} {name:>9} {result['build_s']:>9.2f} {result['build_mb']:>9.0f} {result['bfs_ms']:>9.1f} {result['path_ms']:>9.1f} {result['matches_ms']:>11.0f}")
+
+        if size > args.nx_max:
+            print(f"{size:>9} {'networkx':>9} skipped, above --nx-max")
+
+
+
+if __name__ == '__main__':
+    main()
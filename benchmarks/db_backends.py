@@ -0,0 +1,107 @@
+'''
+Compares query latency of hot ingestion and stats queries on sqlite and mysql backends.
+
+    python benchmarks/db_backends.py            # sqlite only, synthetic data in temp file
+    python benchmarks/db_backends.py --mysql    # also mysql server from .env (schema must exist)
+
+Synthetic rows use ids prefixed with 'bench_' and are deleted at the end.
+'''
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('DB_BACKEND', 'sqlite') #avoid connecting to mysql at import if not required
+os.environ.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(), 'default.db')) #connection created at import, not ./data of checkout
+
+from src.mysql import MysqlConn
+from src.variables import DatasetVar
+
+
+
+def seed(db, num_songs, num_users):
+    '''
+    Inserts synthetic catalog and users
+    '''
+
+    for i in range(num_songs):
+        db.insert_mysql('albums', {'album_id': f'bench_al{i}', 'name': f'Album {i}', 'type': 'album', 'popularity': i % 100, 'release_date': f'{1970 + i % 50}-01-01', 'img_url': ''})
+        db.insert_mysql('artist', {'artist_id': f'bench_ar{i}', 'name': f'Artist {i}', 'popularity': i % 100, 'followers': i, 'img_url': ''})
+        db.insert_mysql('songs', {'song_id': f'bench_s{i}', 'name': f"Song {i} it's", 'album_id': f'bench_al{i}', 'popularity': i % 100, 'preview_url': '', 'genre_model': random.choice(DatasetVar.genre_list)})
+        db.insert_mysql('artist_song', {'artist_id': f'bench_ar{i}', 'song_id': f'bench_s{i}'})
+
+    for user in range(num_users):
+        db.insert_mysql('users', {'user_id': f'bench_u{user}', 'name': f'User {user}', 'country': 'ES', 'num_followers': 0, 'img_url': ''})
+        for song in random.sample(range(num_songs), 100):
+            db.insert_mysql('user_song', {'user_id': f'bench_u{user}', 'song_id': f'bench_s{song}', 'song_score': 100})
+
+
+def clean(db):
+
+    for table, col in [('albums', 'album_id'), ('artist', 'artist_id'), ('songs', 'song_id'), ('artist_song', 'song_id'), ('users', 'user_id'), ('user_song', 'user_id')]:
+        db.execute(f"DELETE FROM {table} WHERE {col} LIKE 'bench\\_%%';")
+
+
+def timeit(func, repeat):
+
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - start) / repeat * 1000 #ms per call
+
+
+def run(db, num_songs, num_users, repeat):
+
+    users = [f'bench_u{i % num_users}' for i in range(repeat)]
+    songs = [f'bench_s{random.randrange(num_songs)}' for i in range(repeat)]
+
+    report_song = MysqlConn.fetch_report_song.__wrapped__ #bypass query cache
+
+    results = {
+        'check_in_table': timeit(lambda i: db.check_in_table('songs', 'song_id', songs[i]), repeat),
+        'insert_user_song': timeit(lambda i: db.insert_mysql('user_song', {'user_id': 'bench_ingest', 'song_id': songs[i], 'song_score': i}), repeat),
+        'delete_where': timeit(lambda i: db.delete_where('user_song', 'bench_ingest', 'user_id'), repeat),
+        'fetch_popularity': timeit(lambda i: list(db.fetch_popularity(users[i])), repeat),
+        'fetch_years_songs': timeit(lambda i: list(db.fetch_years_songs(users[i])), repeat),
+        'find_user_all_songs_genre': timeit(lambda i: list(db.find_user_all_songs_genre(users[i])), repeat),
+        'fetch_report_song': timeit(lambda i: list(report_song(db, songs[i])), repeat),
+    }
+
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mysql', action = 'store_true', help = 'include mysql backend')
+    parser.add_argument('--songs', type = int, default = 2000)
+    parser.add_argument('--users', type = int, default = 20)
+    parser.add_argument('--repeat', type = int, default = 500)
+    args = parser.parse_args()
+
+    backends = {'sqlite': MysqlConn(backend = 'sqlite', path = os.path.join(tempfile.mkdtemp(), 'bench.db'))}
+
+    if args.mysql:
+        backends['mysql'] = MysqlConn(backend = 'mysql')
+
+    all_results = {}
+
+    for name, db in backends.items():
+        print(f'Seeding {name}')
+        clean(db)
+        seed(db, args.songs, args.users)
+        all_results[name] = run(db, args.songs, args.users, args.repeat)
+        clean(db)
+
+    print(f"\n{'query':<28}" + ''.join(f'{name + " (ms)":>14}' for name in all_results))
+    for query in next(iter(all_results.values())):
+        print(f'{query:<28}' + ''.join(f'{results[query]:>14.3f}' for results in all_results.values()))
+
+
+
+if __name__ == '__main__':
+    main()
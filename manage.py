@@ -0,0 +1,59 @@
+'''
+Maintenance commands
+
+    python manage.py rebuild-user-stats
+    python manage.py compact-graph
+    python manage.py update-missing-artists
+'''
+
+import argparse
+
+
+
+def rebuild_user_stats(args):
+
+    import src.dataset_functions as dataset
+
+    num_rows = dataset.rebuild_all_user_stats()
+
+    print(f'{num_rows} user statistics rebuilt')
+
+
+
+def compact_graph(args):
+
+    import src.network as net
+
+    G = net.create_community()
+
+    print(f'Artists community rebuilt: {G.number_of_nodes()} artists, {G.number_of_edges()} edges, version {G.version}')
+
+
+
+def update_missing_artists(args):
+
+    from src.admin import Admin
+    from src.config import user_mysql, password_mysql
+
+    Admin(user_mysql, password_mysql).update_missing_artists()
+
+    print('Missing artists inserted, run compact-graph to add them to artists community')
+
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'SpotiFeat maintenance commands')
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    subparsers.add_parser('rebuild-user-stats', help = 'regenerate user_stats table for all users').set_defaults(func = rebuild_user_stats)
+    subparsers.add_parser('compact-graph', help = 'rebuild artists community from artist_rel table and fold edges log into it').set_defaults(func = compact_graph)
+    subparsers.add_parser('update-missing-artists', help = 'insert artists of any song missing in artist table').set_defaults(func = update_missing_artists)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+
+if __name__ == '__main__':
+    main()
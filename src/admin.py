@@ -4,9 +4,11 @@ import src.model as mod
 import numpy as np
 import src.audio as audio
 from src.variables import AudioVar
+from src.instrument import profiler
 import seaborn as sns
 from sklearn.metrics import accuracy_score
 import matplotlib.pyplot as plt
+from itertools import chain
 
 
 from src.spotify import SpotifyAdmin as spotify
@@ -24,9 +26,14 @@ class Admin():
 
         albums_to_scrape = [album[0] for album in list(self.mysql.fetch_album_in_songs_null())]
 
+        albums_data = self.spotify.get_several_albums(albums_to_scrape) #fetched in batch
+
         for album in albums_to_scrape:
 
-            data = self.spotify.get_album_info(album)
+            if album not in albums_data:
+                continue
+
+            data = albums_data[album]
 
             album_dict = {}
             album_dict['album_id'] = album
@@ -45,10 +52,16 @@ class Admin():
                 self.mysql.insert_mysql('artist_album',{'artist_id' : artist['id'], 'album_id': album})
 
     def update_missing_artists(self):
-        artist_to_scrape = [artist[0] for artist in list(self.mysql.fetch_artist_in_songs_null())]
+        artist_to_scrape = [artist[0] for artist in list(self.mysql.fetch_artist_in_songs_null()) if artist[0] is not None]
+
+        artists_data = self.spotify.get_several_artists(artist_to_scrape) #fetched in batch
 
         for artist in artist_to_scrape:
-            data = self.spotify.get_artist_info(artist)
+
+            if artist not in artists_data:
+                continue
+
+            data = artists_data[artist]
 
             tmp_dict = {}
 
@@ -76,7 +89,7 @@ class Admin():
 
     def prepare_input_to_model(self):
 
-        data = self.mysql.get_info_for_model() 
+        data = chain.from_iterable(self.mysql.iter_info_for_model()) #rows streamed, only decoded arrays kept
 
         X, y = mod.decode_input_model(data)
 
@@ -102,21 +115,13 @@ class Admin():
 
     def get_all_artists_id(self, playlist_id):
 
-        songs_num = 100 #for first round
-        offset = 0
-        artists_id_list = []
-
-        while songs_num == 100:
+        artists_id_list = set()
 
-            data = self.spotify.get_playlist_items_json(playlist_id, offset = offset)['items']
+        for data in self.spotify.iter_playlist_items(playlist_id): #pages of playlist, next one prefetched
             
-            artists_id_list.extend(self.get_artists_ids_from_json(data))
+            artists_id_list.update(self.get_artists_ids_from_json(data))
 
-            songs_num = len(data)
-            
-            offset += songs_num #this is to know if new round moving offset is needed
-
-        artists_id_list = list(set(artists_id_list))
+        artists_id_list = list(artists_id_list)
 
         return artists_id_list
 
@@ -195,21 +200,13 @@ class Admin():
 
     def get_all_song_ids_playlist(self, playlist_id):
 
-        songs_num = 100 #for first round
-        offset = 0
-        songs_id_list = []
-
-        while songs_num == 100:
-
-            data = self.spotify.get_playlist_items_json(playlist_id, offset = offset)['items']
-            
-            songs_id_list.extend(self.get_songs_ids_from_json(data))
+        songs_id_list = set()
 
-            songs_num = len(data)
+        for data in self.spotify.iter_playlist_items(playlist_id): #pages of playlist, next one prefetched
             
-            offset += songs_num #this is to know if new round moving offset is needed
+            songs_id_list.update(self.get_songs_ids_from_json(data))
 
-        songs_id_list = list(set(songs_id_list))
+        songs_id_list = list(songs_id_list)
 
         return songs_id_list
 
@@ -218,20 +215,22 @@ class Admin():
 
         model = mod.import_model('../model/mymodel')
 
-        data = np.array(list(self.mysql.get_all_songs('songs')))
+        with profiler.profile('update_predictions_database'):
 
-        for song in data:
-            song_id = song[0]
+            for data in self.mysql.iter_all_songs('songs'): #chunks of songs, not all mfccs in memory
+
+                for song in data:
+                    song_id = song[0]
 
-            mfcc_decoded = audio.decode_mfccs(song[1], AudioVar.n_mfcc)
+                    mfcc_decoded = audio.decode_mfccs(song[1], AudioVar.n_mfcc)
 
-            preds = mod.get_prediction_prob(model, mfcc_decoded)
+                    preds = mod.get_prediction_prob(model, mfcc_decoded)
 
-            genre = mod.find_genre_max(preds)
+                    genre = mod.find_genre_max(preds)
 
-            encoded_preds = mod.encode_prediction_prob(preds)
+                    encoded_preds = mod.encode_prediction_prob(preds)
 
-            self.mysql.update_prediction(genre, encoded_preds, song_id)
+                    self.mysql.update_prediction(genre, encoded_preds, song_id)
 
 
     def get_confusion_matrix_and_accuracy(self, X_test, y_test):
@@ -0,0 +1,246 @@
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+
+
+class ArtistGraph():
+    '''
+    Compact undirected graph of related artists. Artist ids are interned to integer indices,
+    edges are stored as CSR arrays and names are kept in a lookup table by index.
+    Instances are not modified, add_edges returns a new graph
+    '''
+
+    def __init__(self, ids, names, matrix, version = 0):
+
+        self.ids = ids #index -> artist id
+        self.names = names #index -> artist name
+        self.matrix = matrix #csr adjacency, symmetric
+        self.version = version
+
+        self.index = {artist_id: item for item, artist_id in enumerate(ids)} #artist id -> index
+        self._by_name = None
+
+
+    @classmethod
+    def from_arrays(cls, ids, names, source, target, version = 0):
+        '''
+        Builds graph from edges given as index arrays
+        Args:
+            ids(list): artist ids, position is index
+            names(list): artist names, same order
+            source(array): index of first artist of every edge
+            target(array): index of second artist of every edge
+        '''
+
+        size = len(ids)
+
+        rows = np.concatenate([source, target]).astype(np.int32)
+        cols = np.concatenate([target, source]).astype(np.int32)
+
+        keep = rows != cols #no self loops
+        rows, cols = rows[keep], cols[keep]
+
+        matrix = sp.csr_matrix((np.ones(len(rows), dtype = np.int8), (rows, cols)), shape = (size, size))
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+
+        return cls(list(ids), list(names), matrix, version)
+
+
+    @classmethod
+    def from_edges(cls, chunks, version = 0):
+        '''
+        Builds graph from rows (artist id, artist name, related id, related name), e.g. streamed from database
+        Args:
+            chunks(iterable): lists of rows
+        '''
+
+        return cls([], [], sp.csr_matrix((0, 0), dtype = np.int8), version).add_edges(row for chunk in chunks for row in chunk)
+
+
+    def add_edges(self, rows):
+        '''
+        Returns new graph with edges added
+        Args:
+            rows(iterable): rows (artist id, artist name, related id, related name)
+        Returns:
+            G(ArtistGraph): new graph, same version
+        '''
+
+        ids = list(self.ids)
+        names = list(self.names)
+        index = dict(self.index)
+
+        source = []
+        target = []
+
+        for main_id, main_name, rel_id, rel_name in rows:
+            for artist_id, name in ((main_id, main_name), (rel_id, rel_name)):
+                if artist_id not in index:
+                    index[artist_id] = len(ids)
+                    ids.append(artist_id)
+                    names.append(name)
+
+            source.append(index[main_id])
+            target.append(index[rel_id])
+
+        old = self.matrix.tocoo()
+
+        source = np.concatenate([old.row, np.array(source, dtype = np.int32)])
+        target = np.concatenate([old.col, np.array(target, dtype = np.int32)])
+
+        return ArtistGraph.from_arrays(ids, names, source, target, self.version)
+
+
+    def number_of_nodes(self):
+        return len(self.ids)
+
+    def number_of_edges(self):
+        return self.matrix.nnz // 2
+
+    def has_node(self, artist_id):
+        return artist_id in self.index
+
+    def neighbours(self, item):
+        return self.matrix.indices[self.matrix.indptr[item]:self.matrix.indptr[item + 1]]
+
+
+    def resolve(self, artist):
+        '''
+        Index of an artist given by id or, for configured artists, by name. If several artists
+        have the same name the most connected one is taken. None if not in graph
+        '''
+
+        if artist in self.index:
+            return self.index[artist]
+
+        if self._by_name is None:
+            degree = np.diff(self.matrix.indptr)
+            by_name = {}
+            for item, name in enumerate(self.names):
+                if name not in by_name or degree[item] > degree[by_name[name]]:
+                    by_name[name] = item
+            self._by_name = by_name
+
+        return self._by_name.get(artist)
+
+
+    def bfs(self, source):
+        '''
+        Single source BFS
+        Args:
+            source(int): index of source artist
+        Returns:
+            distance(array): hops from source, -1 if not connected
+            predecessor(array): previous index on a shortest path from source, -1 for source and not connected
+        '''
+
+        order, predecessor = csgraph.breadth_first_order(self.matrix, source, directed = True, return_predecessors = True) #matrix is symmetric
+
+        predecessor = np.where(predecessor < 0, -1, predecessor).astype(np.int32)
+
+        distance = np.full(len(self.ids), -1, dtype = np.int32)
+        distance[source] = 0
+
+        #pointer jumping in BFS order: one vectorized step per level
+        pending = order[1:]
+        while len(pending) > 0:
+            ready = distance[predecessor[pending]] >= 0
+            distance[pending[ready]] = distance[predecessor[pending[ready]]] + 1
+            pending = pending[~ready]
+
+        return distance, predecessor
+
+
+    def shortest_path(self, source, target):
+        '''
+        Shortest path between two artist indices, both included. Empty if not connected.
+        Bidirectional BFS expanding the smaller frontier, whole frontier at once
+        '''
+
+        if source == target:
+            return [source]
+
+        size = len(self.ids)
+        parents = [np.full(size, -2, dtype = np.int32), np.full(size, -2, dtype = np.int32)] #-2 not visited, -1 start
+        depths = [np.full(size, -1, dtype = np.int32), np.full(size, -1, dtype = np.int32)]
+        frontiers = [np.array([source]), np.array([target])]
+
+        for side, start in enumerate((source, target)):
+            parents[side][start] = -1
+            depths[side][start] = 0
+
+        while len(frontiers[0]) > 0 and len(frontiers[1]) > 0:
+
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            other = 1 - side
+
+            rows = self.matrix[frontiers[side]]
+            neighbours = rows.indices
+            owners = np.repeat(frontiers[side], np.diff(rows.indptr))
+
+            new = parents[side][neighbours] == -2
+            neighbours, first = np.unique(neighbours[new], return_index = True)
+            owners = owners[new][first]
+
+            parents[side][neighbours] = owners
+            depths[side][neighbours] = depths[side][owners[0]] + 1 if len(owners) > 0 else 0
+            frontiers[side] = neighbours
+
+            meet = neighbours[parents[other][neighbours] != -2]
+
+            if len(meet) > 0:
+                middle = int(meet[np.argmin(depths[other][meet])])
+
+                path = [middle]
+                while parents[0][path[-1]] != -1:
+                    path.append(int(parents[0][path[-1]]))
+                path = path[::-1]
+                while parents[1][path[-1]] != -1:
+                    path.append(int(parents[1][path[-1]]))
+
+                return path
+
+        return []
+
+
+    def save(self, path):
+        '''
+        Saves graph in a npz file, replaced atomically
+        '''
+
+        with open(f'{path}.tmp', 'wb') as f:
+            np.savez(f, ids = _pack(self.ids), names = _pack(self.names), indptr = self.matrix.indptr,
+                    indices = self.matrix.indices, version = np.array(self.version))
+
+        os.replace(f'{path}.tmp', path)
+
+
+    @classmethod
+    def load(cls, path):
+
+        with np.load(path) as data:
+            ids = _unpack(data['ids'])
+            matrix = sp.csr_matrix((np.ones(len(data['indices']), dtype = np.int8), data['indices'], data['indptr']), shape = (len(ids), len(ids)))
+
+            return cls(ids, _unpack(data['names']), matrix, int(data['version']))
+
+
+
+def _pack(strings):
+    '''
+    List of strings as one utf-8 buffer, much smaller than a fixed width numpy string array
+    '''
+
+    return np.frombuffer('\n'.join(str(string).replace('\n', ' ') for string in strings).encode(), dtype = np.uint8)
+
+
+def _unpack(buffer):
+
+    if len(buffer) == 0:
+        return []
+
+    return buffer.tobytes().decode().split('\n')
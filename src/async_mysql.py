@@ -0,0 +1,71 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from src.variables import DatabaseVar
+from src.mysql import mysql as mysql
+
+
+
+class AsyncMysqlConn():
+    '''
+    Async counterpart of MysqlConn. Every query method of the wrapped connection is exposed
+    as a coroutine with the same name and arguments, returning the rows as a list.
+    Queries run in a pool of worker threads, each one with its own database connection,
+    so independent queries can be gathered concurrently:
+
+        popularity, years = await asyncio.gather(amysql.fetch_popularity(user), amysql.fetch_years_songs(user))
+    '''
+
+    def __init__(self, conn, max_workers = DatabaseVar.async_workers):
+
+        self._conn = conn
+        self._executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = 'async_mysql')
+
+
+    def __getattr__(self, name):
+
+        method = getattr(self._conn, name)
+
+        if not callable(method):
+            return method
+
+        async def coroutine(*args, **kwargs):
+            return await self.run(_fetch_all, method, *args, **kwargs)
+
+        coroutine.__name__ = name
+        coroutine.__doc__ = method.__doc__
+
+        return coroutine
+
+
+    async def run(self, func, *args, **kwargs):
+        '''
+        Runs any blocking function in database workers, e.g. dataset functions not migrated yet
+        Args:
+            func(function): blocking function
+        '''
+
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context() #keeps query profile of request in workers
+
+        return await loop.run_in_executor(self._executor, context.run, partial(func, *args, **kwargs))
+
+
+
+def _fetch_all(method, *args, **kwargs):
+    '''
+    Calls query method and materializes its result inside worker thread
+    '''
+
+    result = method(*args, **kwargs)
+
+    if getattr(result, 'returns_rows', False): #result proxy with rows, other values returned as they are
+        return [tuple(row) for row in result]
+
+    return result
+
+
+
+amysql = AsyncMysqlConn(mysql)
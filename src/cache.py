@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+
+class QueryCache():
+    '''
+    Bounded LRU cache with time to live for the results of read queries.
+    Every entry is tagged with the tables it was read from so writes on a table
+    only invalidate the entries depending on it.
+    '''
+
+    def __init__(self, max_size, ttl):
+
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries = OrderedDict() #key -> (expires, tables, rows)
+        self._by_table = {} #table -> set of keys
+        self._generations = {} #table -> number of invalidations, to detect writes during a query
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+
+    def get(self, key):
+        '''
+        Looks up a key in cache
+        Args:
+            key(tuple): query key
+        Returns:
+            found(bool): True if a valid entry was found
+            rows(list): cached rows, None if not found
+        '''
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            expires, tables, rows = entry
+
+            if expires < time.monotonic(): #stale entry
+                self._remove(key)
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return True, list(rows)
+
+
+    def generation(self, tables):
+        '''
+        Generation of tables, to be read before running query and given to set
+        '''
+
+        with self._lock:
+            return tuple(self._generations.get(table, 0) for table in tables)
+
+
+    def set(self, key, rows, tables, generation = None):
+        '''
+        Saves rows of a query in cache
+        Args:
+            key(tuple): query key
+            rows(list): rows returned by database
+            tables(tuple): tables the query depends on
+            generation(tuple): generation of tables before query. If a table was invalidated since, rows may be stale and are not saved
+        '''
+
+        with self._lock:
+            if generation is not None and generation != tuple(self._generations.get(table, 0) for table in tables):
+                return
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.monotonic() + self.ttl, tables, tuple(rows))
+
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+
+            while len(self._entries) > self.max_size: #least recently used out
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+
+    def invalidate(self, table):
+        '''
+        Drops every entry depending on a table. To be called after any write on it
+        Args:
+            table(str): name of table modified
+        '''
+
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            keys = self._by_table.pop(table, set())
+
+            for key in keys:
+                self._remove(key)
+
+            self.invalidations += len(keys)
+
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+
+
+    def stats(self):
+        '''
+        Returns hit rate statistics of cache
+        '''
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            hit_rate = round(self.hits / lookups, 3) if lookups else 0.0
+
+            return {'size': len(self._entries), 'max_size': self.max_size, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'hit_rate': hit_rate,
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+    def _remove(self, key):
+
+        expires, tables, rows = self._entries.pop(key)
+
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+
+
+
+def cached_query(*tables, table_arg = None):
+    '''
+    Decorator for read methods of MysqlConn. Rows are materialized and served from the instance cache.
+    Cache is skipped right after a write of same user or session, and rows that may come from a lagging
+    replica are not cached
+    Args:
+        tables(str): tables the query reads from
+        table_arg(int): position of the argument holding the table name, for generic queries
+    '''
+
+    def decorator(method):
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+
+            query_tables = tables if table_arg is None else (args[table_arg],)
+
+            key = (method.__name__, args, tuple(sorted(kwargs.items())))
+
+            if self.recent_write(): #read your writes, from primary
+                return [tuple(row) for row in method(self, *args, **kwargs)]
+
+            found, rows = self.cache.get(key)
+            if found:
+                return rows
+
+            generation = self.cache.generation(query_tables) #a write while querying makes rows stale
+
+            rows = [tuple(row) for row in method(self, *args, **kwargs)]
+
+            if self.cacheable(query_tables):
+                self.cache.set(key, rows, query_tables, generation)
+
+            return rows
+
+        return wrapper
+
+    return decorator
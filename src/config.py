@@ -10,11 +10,20 @@ client_id = os.getenv('CLIENT_ID')
 client_secret = os.getenv('CLIENT_SECRET')
 redirect_uri = 'http://localhost:5000/callback'
 
+spotify_api_url = os.getenv("SPOTIFY_API_URL", 'https://api.spotify.com') #e.g. http://localhost:8000 to run against src/fake_spotify.py
+spotify_accounts_url = os.getenv("SPOTIFY_ACCOUNTS_URL", 'https://accounts.spotify.com')
+
 
 db_name = 'spotify_project'
 password_mysql = os.getenv("MYSQL_PWD")
 user_mysql = os.getenv("MYSQL_USER")
 
+db_backend = os.getenv("DB_BACKEND", 'mysql') #'mysql' or 'sqlite' for single node deployments and tests
+sqlite_path = os.getenv("SQLITE_PATH", './data/spotify_project.db')
+
+db_primary_url = os.getenv("DB_PRIMARY_URL") #overrides default mysql url built from user and password
+db_replica_urls = [url for url in os.getenv("DB_REPLICA_URLS", '').split(',') if url] #comma separated urls for read only queries
+
 app_secret_key =  b'_5#y2L"F4Q8z\n\xec]/'
 
 
@@ -1,7 +1,9 @@
-from src.variables import AudioVar, DatasetVar, DatabaseVar, ScoringVar, Community
+from src.variables import AudioVar, DatasetVar, DatabaseVar, ScoringVar, Community, MarketVar
+from src.markets import MarketHints
 
 import src.spotify as spotify
 from src.mysql import mysql as mysql
+from src.async_mysql import amysql as amysql
 import src.network as net
 
 import os
@@ -18,6 +20,10 @@ from sklearn.metrics.pairwise import cosine_similarity
 
 import collections
 import requests
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 path_temp_mp3 = AudioVar.path_temp_mp3
@@ -36,6 +42,9 @@ markets = ['ES', 'US', 'SE','DZ','EG','MA','ZA','TN','BH','HK','IN','IL','JP','J
 ,'AR','BO','BR','CL','CO','EC','PY','PE','UY','AU','NZ']
 model = mod.import_model(AudioVar.model_path)
 
+market_hints = MarketHints()
+market_executor = ThreadPoolExecutor(max_workers = MarketVar.max_parallel, thread_name_prefix = 'markets')
+
 
 
 
@@ -122,11 +131,13 @@ def get_mfccs(mp3_link, file_path):
     return mfccs, mfccs_array
 
 
-def insert_song_data(headers, song_id, col_name = 'song_id'):
+def insert_song_data(headers, song_id, col_name = 'song_id', data = None, insert_artists = True):
     '''
     Insert new song to database
     Args:
         song_id(str): song id
+        data(dict): raw data of song if already fetched in batch
+        insert_artists(bool): if False, new artists of song are left for update_missing_artists
     
     '''
 
@@ -137,23 +148,16 @@ def insert_song_data(headers, song_id, col_name = 'song_id'):
         
         pass
     else:
-        data = spotify._get_json_song(headers,song_id) # raw data of a song
+        if data is None:
+            data = spotify._get_json_song(headers,song_id) # raw data of a song
 
         
 
         if (data['preview_url'] is None): #checks if it finds preview url
             print('Preview url null. Finding through markets a previeuw url')
-            for country in markets: #if no preview url found, then iterates through differnt markets to find preview url
-                print(f'Trying {country}')
-                data = spotify._get_json_song(headers, song_id, country) #new try raw data
-                if not (data['preview_url'] is None): #finds preview url
-                    print('Preview url found', data['preview_url'])
-
-                    break
-                else:
-                    pass
+            data = probe_markets_preview(headers, song_id, data) #if no preview url found, then tries differnt markets to find preview url
 
-            if (data['preview_url'] is None): #if it is still none
+            if data is None: #if it is still none
                 return False
 
 
@@ -162,22 +166,98 @@ def insert_song_data(headers, song_id, col_name = 'song_id'):
 
 
         data, data2 = get_info_song(data, path_temp_mp3) #data is song_dict and data2 is artist_song_id info
-        mysql.insert_mysql('songs',data)
 
-        new = False
+        with mysql.transaction(): #song and its artists rows committed together
+            mysql.insert_mysql('songs',data)
+            mysql.insert_many('artist_song', data2) #this inserts into artist_song all rows
 
-        for item in data2: #this inserts into artist_song all rows
-            mysql.insert_mysql('artist_song',item)
-
-            if mysql.check_in_table('artist','artist_id', item['artist_id']):
-                pass
-            else:
-                insert_new_artist(headers, item['artist_id'])#check if artist in artist table
-                new = True #to know if a new user were introduced to update network community
+        if insert_artists:
+            new_artists = [item['artist_id'] for item in data2 if not mysql.check_in_table('artist','artist_id', item['artist_id'])] #check if artist in artist table
+            insert_new_artists(headers, new_artists)
 
     return True
 
 
+def probe_markets_preview(headers, song_id, data):
+    '''
+    Looks for a market where song has preview url. Markets are probed in parallel, the ones which worked
+    before for same album or artists first, and pending probes are cancelled once one is found.
+    Songs known without preview are skipped. A song is only known without preview if every market answered
+    with the track and no preview url, not after errors
+    Args:
+        song_id(str): song id
+        data(dict): raw data of song without market
+    Returns:
+        data(dict): raw data of song in a market with preview url, None if not found
+    '''
+
+    if market_hints.is_dead(song_id):
+        print('Song known without preview url')
+        return None
+
+    album_id = data.get('album', {}).get('id')
+    artist_ids = [artist['id'] for artist in data.get('artists', [])]
+
+    found = threading.Event()
+
+    def probe(country):
+        if found.is_set():
+            return country, None
+        try:
+            return country, spotify._get_json_song(headers, song_id, country)
+        except (requests.RequestException, ValueError): #network error or body not json, market unknown
+            return country, None
+
+    futures = [market_executor.submit(probe, country) for country in market_hints.rank(markets, album_id, artist_ids)]
+
+    answered = 0 #markets answering with a valid track without preview url
+
+    try:
+        for future in as_completed(futures):
+            country, data_market = future.result()
+
+            if not isinstance(data_market, dict) or 'error' in data_market or 'preview_url' not in data_market: #429, 5xx...
+                continue
+
+            if data_market['preview_url'] is None:
+                answered += 1
+
+            else: #finds preview url
+                found.set()
+                print(f'Preview url found in {country}', data_market['preview_url'])
+                market_hints.record_found(country, album_id, artist_ids)
+                return data_market
+    finally:
+        for future in futures:
+            future.cancel() #pending probes not needed
+
+    if answered == len(futures):
+        market_hints.record_dead(song_id)
+
+    return None
+
+
+def insert_songs_data(headers, song_ids):
+    '''
+    Inserts several new songs to database. Songs and then their missing artists are fetched in batches
+    Args:
+        song_ids(list): list of song ids not in database
+    Returns:
+        inserted(dict): song id -> False if song could not be inserted (no preview url)
+    '''
+
+    tracks = spotify.get_several_tracks(headers, song_ids)
+
+    inserted = {}
+    for song_id in song_ids:
+        print(f"{song_id} song not in database")
+        inserted[song_id] = insert_song_data(headers, song_id, data = tracks.get(song_id), insert_artists = False)
+
+    update_missing_artists(headers, [song_id for song_id in song_ids if inserted[song_id]]) #artists of new songs only, in batch
+
+    return inserted
+
+
 
 
 
@@ -195,9 +275,17 @@ def get_my_full_top_50(headers):
     
     '''
     
-    short_term_50 = spotify.get_top_50('short_term', headers)
-    medium_term_50 = spotify.get_top_50('medium_term', headers)
-    long_term_50 = spotify.get_top_50('long_term', headers)
+    short_term_50, medium_term_50, long_term_50 = spotify.client.gather((spotify.get_top_50, 'short_term', headers),
+                                                                        (spotify.get_top_50, 'medium_term', headers),
+                                                                        (spotify.get_top_50, 'long_term', headers))
+
+    return calc_full_top_50(short_term_50, medium_term_50, long_term_50)
+
+
+def calc_full_top_50(short_term_50, medium_term_50, long_term_50):
+    '''
+    Scores songs of top50 lists of a user for short, mid and long term.
+    '''
     
     top_songs_dict = {}
     
@@ -252,7 +340,13 @@ def collect_my_user_profile(headers):
     temp_dict_user = {}
     temp_list_top_songs = []
 
-    data = spotify.get_my_user_info(headers) #request to spotify api with raw data
+    #independent requests to spotify api sent concurrently: user raw data, top50 songs for all time ranges and top artists
+    data, short_term_50, medium_term_50, long_term_50, temp_list_top_artists = spotify.client.gather(
+                                                                                    (spotify.get_my_user_info, headers),
+                                                                                    (spotify.get_top_50, 'short_term', headers),
+                                                                                    (spotify.get_top_50, 'medium_term', headers),
+                                                                                    (spotify.get_top_50, 'long_term', headers),
+                                                                                    (spotify.get_user_top_artist, headers))
 
     user_id = data['id']
     user_country = data['country']
@@ -264,27 +358,22 @@ def collect_my_user_profile(headers):
     except IndexError:
         user_img_url ='' #this will change to predefined unkown pic in app
     
-    finally:
 
-        top50 = get_my_full_top_50(headers) #get info related to top50 songs for all time ranges
+    top50 = calc_full_top_50(short_term_50, medium_term_50, long_term_50) #get info related to top50 songs for all time ranges
 
 
-        temp_dict_user = {'user_id': user_id,
-                    'name' : user_name ,
-                    'country': user_country,
-                    'num_followers': user_num_followers,
-                    'img_url' : user_img_url,
-                    }
+    temp_dict_user = {'user_id': user_id,
+                'name' : user_name ,
+                'country': user_country,
+                'num_followers': user_num_followers,
+                'img_url' : user_img_url,
+                }
 
-        for key, value in top50.items():
-            temp_list_top_songs.append({'user_id': user_id, 'song_id': key, 'song_score': value})
+    for key, value in top50.items():
+        temp_list_top_songs.append({'user_id': user_id, 'song_id': key, 'song_score': value})
 
 
-        #top artists ################
-
-        temp_list_top_artists = spotify.get_user_top_artist(headers)
-
-        return temp_dict_user, temp_list_top_songs, temp_list_top_artists
+    return temp_dict_user, temp_list_top_songs, temp_list_top_artists
 
 
 def update_user_profile_data(headers):
@@ -303,81 +392,49 @@ def update_user_profile_data(headers):
 
     
 
-    ##Update users table
-    print('Updating user info to database')
-
-    if mysql.check_in_table(table_name, main_col, user_id): #checks if user already in user table
+    ##Scraping of new artists and songs. Catalog rows are committed per artist or song
 
-        for key, value in user_profile.items():
-            if key != 'user_id':
-                mysql.update_database(table_name, main_col, key, user_id, value) #updates all fields with new data. #this may be optimized and only update if changes present
-            else:
-                pass
-    else: #new user ever
-        mysql.insert_mysql(table_name, user_profile)
+    print('Updating catalog with new artists')
 
-    print('Task done')
+    new_artists = [artist for artist in user_top_artists if not mysql.check_in_table('artist', 'artist_id', artist)] #check if artist in artist table
 
-    ##### Update user_artist table  #############################
-    
-    print('Updating user artists to database')
+    insert_new_artists(headers, new_artists) #fetched in batch
 
-    if mysql.check_in_table('user_artist', 'user_id', user_id): #checks if user is already in user_artist table
-        mysql.delete_where('user_artist', user_id, 'user_id') #deletes old info
-    else:
-        pass
+    print('Task done')
 
-    new = False #initial value 
+    print('Updating catalog with new songs')
 
-    for artist in user_top_artists:
+    new_songs = [song['song_id'] for song in user_top_songs if not mysql.check_in_table(songs_table, 'song_id', song['song_id'])] #check if song in songs_table
 
-        if not mysql.check_in_table('artist', 'artist_id', artist): #check if artist in artist table
-            insert_new_artist(headers, artist)
-            new = True #to know if a new user were introduced to update network community
-        else:
-            pass
+    inserted = insert_songs_data(headers, new_songs) #fetched in batch
 
-        data  = {'user_id': user_id, 'artist_id': artist}
-        mysql.insert_mysql('user_artist', data) #insertes to mysql the favourtie artist for user
+    valid_songs = [song for song in user_top_songs if inserted.get(song['song_id'], True)] #songs without preview url are not included
 
     print('Task done')
-        
-        
-  
-
-    ##Update users_songs table
-
-    print('Updating user songs to database')
-
-    table_name = DatabaseVar.user_songs_table
-    main_col = 'user_id'
 
-    if mysql.check_in_table(table_name, main_col, user_id): #if user in table, delete to update later
-        mysql.delete_where(table_name, user_id, main_col) #delete
-    else:
-        pass
-    
-    for song in user_top_songs:
 
-        res = True
+    ##Update users, user_artist and user_songs tables in one transaction. Readers see either old or new profile
 
-        #here !!!!! first check if song in songs database, if not then get data 
-        if not mysql.check_in_table(songs_table, 'song_id', song['song_id']): #check if song in songs_table
+    print('Updating user info, artists and songs to database')
 
-            print(f"{song['song_id']} song not in database")
-            res = insert_song_data(headers, song['song_id']) #insert song to database
+    with mysql.transaction():
 
-            
-        else: #if exists then
-            pass #do nothing
+        if mysql.check_in_table(table_name, main_col, user_id): #checks if user already in user table
 
+            for key, value in user_profile.items():
+                if key != 'user_id':
+                    mysql.update_database(table_name, main_col, key, user_id, value) #updates all fields with new data. #this may be optimized and only update if changes present
+                else:
+                    pass
+        else: #new user ever
+            mysql.insert_mysql(table_name, user_profile)
 
-        if not res: #it did not find preview url then abort inclusion
-            continue
 
+        mysql.delete_where('user_artist', user_id, 'user_id') #deletes old info
+        mysql.insert_many('user_artist', [{'user_id': user_id, 'artist_id': artist} for artist in user_top_artists]) #favourite artists for user
 
-        table_name = DatabaseVar.user_songs_table
-        mysql.insert_mysql(table_name, song) #Now we add all info
+        mysql.delete_where(DatabaseVar.user_songs_table, user_id, main_col) #delete old top songs
+        mysql.insert_many(DatabaseVar.user_songs_table, valid_songs) #Now we add all info
 
 
     print('Task done')
@@ -385,15 +442,16 @@ def update_user_profile_data(headers):
     print('Updating albums database if needed')
 
     update_albums_table_missing(headers) #this checks if new albums have been introduced and scrapes data
-    print('Updating artist database if needed')
-    update_missing_artists(headers) #this check if some artist is missing in table for some trailing error
+    #artists of new songs were inserted with them. Whole table check is offline, manage.py update-missing-artists
 
     print('Task done')
 
-    print('Recreating artists community')
-    net.create_community() #always update at every login. This could be optimized if new artist found by top artist or artist in top songs. Not that "easy" to do if in new songs , therefore we create community every time
+    print('Updating artists community')
+    net.apply_new_artists() #only edges of artists inserted during ingestion. Full rebuild is offline, manage.py compact-graph
 
     print('Task done')
+
+    refresh_user_stats(user_id) #materialized stats for profile pages
     
 
     return user_profile, user_top_songs
@@ -407,16 +465,45 @@ def insert_new_artist(headers, artist):
         artist(str): artist id
     '''
 
-    print(f"{artist} artist not in database")
-    tmp_dict = get_info_artist(artist, headers)
-    mysql.insert_mysql('artist', tmp_dict) #inserted into mysql table artist
-    data = spotify.get_artist_related(artist, headers).get('artists') #list of artist related
+    insert_new_artists(headers, [artist])
+
+
+def insert_new_artists(headers, artists):
+    '''
+    Insert new artists in database. Artists info is fetched in batch, related artists one by one (no multi id endpoint).
+    Inserted artists are recorded to add their edges to artists community
+    Args:
+        artists(list): list of artist ids
+    Returns:
+        inserted(list): ids of artists inserted
+    '''
+
+    inserted = []
+
+    if len(artists) == 0:
+        return inserted
+
+    artists_data = spotify.get_several_artists(headers, artists)
+
+    for artist in artists:
+
+        if artist not in artists_data:
+            print(f'{artist} artist data not found.')
+            continue
+
+        print(f"{artist} artist not in database")
+        tmp_dict = get_info_artist(artist, headers, artists_data[artist])
+        data = spotify.get_artist_related(artist, headers).get('artists') #list of artist related
 
-    for element in data: #for each artist related
-        id_tmp = element['id']
-        tmp_dict = {'main_id': artist, 'rel_id': id_tmp}
-        mysql.insert_mysql('artist_rel', tmp_dict)
+        with mysql.transaction():
+            mysql.insert_mysql('artist', tmp_dict) #inserted into mysql table artist
+            mysql.insert_many('artist_rel', [{'main_id': artist, 'rel_id': element['id']} for element in data]) #for each artist related
 
+        inserted.append(artist)
+
+    net.record_new_artists(inserted)
+
+    return inserted
     
 
 
@@ -825,7 +912,7 @@ def create_mix_playlist(headers, users, num_songs =AudioVar.num_song_playlist):
 
     data = spotify.create_playlist(headers, users)
     playlist_id = data['id']
-    spotify.add_songs_to_playlist(playlist_id, song_id_list, headers)
+    spotify.add_songs_to_playlist(playlist_id, song_id_list, headers) #raises PlaylistIncomplete, a shorter playlist is not a success
 
     url_playlist = data['external_urls'].get('spotify')
 
@@ -950,12 +1037,15 @@ def scrape_artists(self, seed_artist = None):
 
 
 
-def get_info_artist(artist_id, headers):
+def get_info_artist(artist_id, headers, data = None):
     '''
     Fetches from spotify api info related to artist and returns artist info in format to be inserted to database
+    Args:
+        data(dict): raw data of artist if already fetched in batch
     '''
 
-    data = spotify.get_artist_info(artist_id, headers)
+    if data is None:
+        data = spotify.get_artist_info(artist_id, headers)
 
  
 
@@ -1001,30 +1091,39 @@ def fetch_user2_profile(user):
 
 
 def get_info_distances_between_users(user1, user2):
+    '''
+    Average distance, min distance and min path between top artists of two users. Searches each pair
+    of artists, a BFS from every artist of user1 only pays off when comparing many users
+    Returns:
+        distance(tuple): (avg_distance, min_distance, min_path)
+    '''
 
+    main_artists = [item[0] for item in list(mysql.fetch_user_artist_ids(user1))]
+    artists = [item[0] for item in list(mysql.fetch_user_artist_ids(user2))]
 
-    G = net.load_community()
+    return net.pair_distances(main_artists, artists)
 
 
-    user1_artists = [item[0] for item in list(mysql.fetch_user_artists(user1)) if net.check_if_in_G(G,item[0])]
-    user2_artists = [item[0] for item in list(mysql.fetch_user_artists(user2)) if net.check_if_in_G(G,item[0])]
-    
-    distances = []
-    min_distance = 100000 #dummy large value
-    min_path = []
-    for artist in user1_artists:
-        for rel_artist in user2_artists:
-            distance = net.shortest_path_len(G, artist, rel_artist)
-            distances.append(distance)
-            if distance < min_distance:
-                min_distance = distance
-                min_path = net.shortest_path(G,  artist, rel_artist)
-            else:
-                pass
+def get_info_distances_users(main_user, other_users):
+    '''
+    Average distance, min distance and min path between top artists of main user and top artists of every other user
+    Args:
+        main_user(str): user id
+        other_users(list): list of user ids
+    Returns:
+        distances(dict): keys are user ids, values (avg_distance, min_distance, min_path)
+    '''
 
-    avg_distance = round(np.mean(distances),1)
+    if len(other_users) == 0:
+        return {}
 
-    return avg_distance, min_distance, min_path
+    main_artists = [item[0] for item in list(mysql.fetch_user_artist_ids(main_user))]
+
+    users_artists = {other: [] for other in other_users}
+    for other, artist in mysql.fetch_users_artist_ids(other_users): #all users in one query
+        users_artists[other].append(artist)
+
+    return net.users_distances(main_artists, users_artists) #one BFS per artist of main user for all users
 
 
 def get_my_matches(main_user):
@@ -1093,9 +1192,11 @@ def get_score_by_distance(main_user, other_users):
 
     
 
+    all_distances = get_info_distances_users(main_user, other_users)
+
     info_distances = []
     for other in other_users:
-        avg_distance, min_distance, min_path = get_info_distances_between_users(main_user, other)
+        avg_distance, min_distance, min_path = all_distances[other]
 
         tmp_dict = {'user_name': other, 'avg_distance':avg_distance, 'min_distance': min_distance, 'min_path':min_path }
         info_distances.append(tmp_dict)
@@ -1133,27 +1234,27 @@ def fecth_match_score(user_id, other_users_info):
 
 
 
-def get_info_distances_artist_ref(user):
+def get_info_distances_artist_ref(user, ref_artist = Community.artist_ref_distance):
 
     print('Calculating distances for community')
 
-    G = net.load_community()
+    ref = net.community.reference(ref_artist) #distances from reference artist, one BFS per graph version
 
     
-    user_artists = [item[0] for item in list(mysql.fetch_user_artists(user)) if net.check_if_in_G(G,item[0])] #this is to avoid take into account artist which are not connected to community
+    user_artists = [item[0] for item in list(mysql.fetch_user_artist_ids(user)) if item[0] in ref.index] #this is to avoid take into account artist which are not connected to community
     
-    user_artists = sorted(user_artists, key = lambda x: net.shortest_path_len(G, x))
+    distances = {artist: ref.distance_to(artist) for artist in user_artists}
+
+    user_artists = sorted(user_artists, key = lambda x: distances[x])
     
-    distances = [net.shortest_path_len(G, artist)   for artist in user_artists]
+    distances = [distances[artist] for artist in user_artists]
     avg_distance = round(np.mean(distances),1)
 
     min_distance = distances[0]
 
-    min_path = net.shortest_path(G, user_artists[0])
-
-    min_path = list(map(extract_url_img_by_artist_name, min_path))
+    min_path = ref.path_to(user_artists[0])
 
-    ref_artist = Community.artist_ref_distance #to pass to app to show in html
+    min_path = list(map(extract_url_img_by_artist_id, min_path))
 
 
     print('Task done')
@@ -1164,6 +1265,14 @@ def get_info_distances_artist_ref(user):
     return avg_distance, min_distance, min_path, ref_artist
 
 
+def extract_url_img_by_artist_id(artist_id):
+
+    artist_name, artist_url = list(mysql.fetch_column_table_where('artist', 'name, img_url', 'artist_id', artist_id))[0]
+
+
+    return {'name': artist_name, 'artist_url': artist_url}
+
+
 def extract_url_img_by_artist_name(artist_name):
 
     artist_url = list(mysql.fetch_column_table_where('artist', 'img_url', 'name', artist_name))[0][0]
@@ -1192,7 +1301,7 @@ def get_rating_popu_user(user):
     print('Calculating popularity')
 
     songs = list(mysql.fetch_popularity(user))
-    avg_pop = int(np.mean([song[1] for song in songs]))
+    avg_pop = calc_rating_popu(songs)
 
     #con posibilidad de poder devolver el mayor popular
 
@@ -1200,18 +1309,28 @@ def get_rating_popu_user(user):
     return avg_pop
 
 
+def calc_rating_popu(songs):
+
+    return int(np.mean([song[1] for song in songs]))
+
+
 def get_years_user(user):
 
     print('Calculating musical age')
 
     data = list(mysql.fetch_years_songs(user))
 
+    print('Task done')
+
+    return calc_years(data)
+
+
+def calc_years(data):
+
     list_dates = [item[0] for item in data]
 
     list_ages = list(map(extract_age_date, list_dates))
 
-    print('Task done')
-
     return round(np.mean(list_ages),1)
 
 def extract_age_date(date):
@@ -1248,6 +1367,138 @@ def get_other_users_info(main_user_id):
     return others_info
 
 
+async def gather_user_stats(user_id):
+    '''
+    Calculates concurrently from raw tables all independent statistics of a user
+    Args:
+        user_id(str): user id
+    Returns:
+        stats(dict): distances to reference artist, popularity, musical age and genre profile
+    '''
+
+    results = await asyncio.gather(amysql.run(get_info_distances_artist_ref, user_id),
+                                amysql.fetch_popularity(user_id),
+                                amysql.fetch_years_songs(user_id),
+                                amysql.find_user_all_songs_genre(user_id))
+
+    avg_distance, min_distance, path_distance, ref_artist = results[0]
+    genre_list, values_list = calc_genre_profile(results[3])
+
+    stats = {'avg_dis': avg_distance, 'min_dis': min_distance, 'path_dis': path_distance, 'ref_artist': ref_artist,
+            'avg_popu': calc_rating_popu(results[1]), 'avg_age': calc_years(results[2]),
+            'genre_list': genre_list, 'values_chart': values_list}
+
+    return stats
+
+
+def build_user_stats_row(user_id, stats):
+    '''
+    Converts user statistics to row of user_stats table. Unknown musical age is stored as NULL
+    '''
+
+    avg_age = stats['avg_age'] if not np.isnan(stats['avg_age']) else None #some release dates without year
+
+    return {'user_id': user_id,
+            'avg_popularity': int(stats['avg_popu']),
+            'avg_age': float(avg_age) if avg_age is not None else None,
+            'genre_counts': json.dumps([int(value) for value in stats['values_chart']]),
+            'avg_distance': float(stats['avg_dis']),
+            'min_distance': int(stats['min_dis']),
+            'min_path': json.dumps(stats['path_dis'])}
+
+
+def refresh_user_stats(user_id):
+    '''
+    Recalculates statistics of a user and replaces its row in user_stats table in one transaction
+    Args:
+        user_id(str): user id
+    Returns:
+        True if row was replaced, False if statistics could not be calculated
+    '''
+
+    print('Updating user statistics')
+
+    try:
+        row = build_user_stats_row(user_id, asyncio.run(gather_user_stats(user_id)))
+    except (IndexError, ValueError): #users without artists in community or songs
+        print(f'Statistics for {user_id} could not be calculated')
+        return False
+
+    with mysql.transaction(): #cached rows invalidated again after commit
+        mysql.delete_where('user_stats', user_id, 'user_id')
+        mysql.insert_mysql('user_stats', row)
+
+    print('Task done')
+
+    return True
+
+
+def rebuild_all_user_stats():
+    '''
+    Regenerates user_stats table for all users. Rows are calculated first and swapped in one transaction
+    '''
+
+    rows = []
+    for user in tqdm([user[0] for user in mysql.find_all_users()]):
+        try:
+            rows.append(build_user_stats_row(user, asyncio.run(gather_user_stats(user))))
+        except (IndexError, ValueError): #users without artists in community or songs
+            print(f'Statistics for {user} could not be calculated')
+
+    with mysql.transaction():
+        mysql.execute("DELETE FROM user_stats;")
+        mysql.insert_many('user_stats', rows)
+
+    mysql.cache.invalidate('user_stats')
+
+    return len(rows)
+
+
+def get_user_stats(user_id):
+    '''
+    Reads materialized statistics of a user, calculating them if missing
+    Args:
+        user_id(str): user id
+    Returns:
+        stats(dict): distances to reference artist, popularity, musical age and genre profile.
+        Empty statistics if they cannot be calculated, e.g. user without songs
+    '''
+
+    match = list(mysql.fetch_user_stats(user_id))
+
+    if len(match) == 0 and refresh_user_stats(user_id):
+        match = list(mysql.fetch_user_stats(user_id))
+
+    if len(match) == 0:
+        return {'avg_dis': np.nan, 'min_dis': np.nan, 'path_dis': [], 'ref_artist': Community.artist_ref_distance,
+                'avg_popu': np.nan, 'avg_age': np.nan,
+                'genre_list': DatasetVar.genre_list, 'values_chart': [0] * len(DatasetVar.genre_list)}
+
+    avg_popularity, avg_age, genre_counts, avg_distance, min_distance, min_path = match[0]
+
+    stats = {'avg_dis': avg_distance, 'min_dis': min_distance, 'path_dis': json.loads(min_path), 'ref_artist': Community.artist_ref_distance,
+            'avg_popu': avg_popularity, 'avg_age': avg_age if avg_age is not None else np.nan, #NULL when release dates have no year
+            'genre_list': DatasetVar.genre_list, 'values_chart': json.loads(genre_counts)}
+
+    return stats
+
+
+async def gather_intro_data(user_id):
+    '''
+    Statistics and matches of a user for intro page, read and calculated concurrently
+    Args:
+        user_id(str): user id
+    Returns:
+        stats(dict): see get_user_stats
+        matches(list): other users sorted by match score
+    '''
+
+    stats, matches = await asyncio.gather(asyncio.to_thread(get_user_stats, user_id), #own thread, a refresh uses database workers too
+                                        amysql.run(get_my_matches, user_id))
+
+    return stats, matches
+
+
 def get_full_info_user(user_id):
 
     profile = fetch_user2_profile(user_id)
@@ -1268,13 +1519,7 @@ def get_full_info_user(user_id):
 
 def collect_info_new_playlist(headers, song_id_list):
 
-    info_playlist = []
-
-    for song in song_id_list:
-
-        info_song = get_info_song_dict_by_id(song)
-
-        info_playlist.append(info_song)
+    info_playlist = get_info_songs_by_ids(song_id_list)
 
 
     return info_playlist
@@ -1286,6 +1531,29 @@ def get_info_song_dict_by_id(song):
     match = list(mysql.fetch_report_song(song))[0]
 
 
+    return build_info_song(match)
+
+
+def get_info_songs_by_ids(song_id_list):
+    '''
+    Fetches info of several songs with one query
+    Args:
+        song_id_list(list): list of song ids
+    Returns:
+        info_songs(list): info dicts in same order as song_id_list. Songs not in database are skipped
+    '''
+
+    report, missing = mysql.fetch_report_songs(song_id_list)
+
+    if len(missing) > 0:
+        print(f'{len(missing)} songs not in database: {missing}')
+
+    return [build_info_song(match) for match in report.values()]
+
+
+def build_info_song(match):
+
+
     song_name = match[0]
     artist_name = match[1]
     album_name = match[2]
@@ -1308,7 +1576,12 @@ def get_info_song_dict_by_id(song):
 
 def genre_profile_api(user_id):
 
-    user_profile = np.array(list(mysql.find_user_all_songs_genre(user_id)))
+    return calc_genre_profile(list(mysql.find_user_all_songs_genre(user_id)))
+
+
+def calc_genre_profile(rows):
+
+    user_profile = np.array(rows)
     user_profile = calc_user_profile_genre(user_profile)
 
     genre_list = list(user_profile.keys())
@@ -1326,10 +1599,7 @@ def get_my_trending(headers):
 
     trending_songs = spotify.get_top_50('short_term', headers)
 
-    info_trending = []
-    for song in trending_songs:
-        info_song = get_info_song_dict_by_id(song)
-        info_trending.append(info_song)
+    info_trending = get_info_songs_by_ids(trending_songs)
 
     return info_trending
 
@@ -1338,18 +1608,7 @@ def get_my_top(headers):
 
     top_songs = spotify.get_top_50('long_term', headers)
 
-    info_top = []
-    for song in top_songs:
-
-        try:
-
-            info_song = get_info_song_dict_by_id(song)
-
-        except:
-            continue
-
-        else:
-            info_top.append(info_song)
+    info_top = get_info_songs_by_ids(top_songs)
 
     return info_top
 
@@ -1363,59 +1622,58 @@ def update_albums_table_missing(headers):
 
     albums_to_scrape = [album[0] for album in list(mysql.fetch_album_in_songs_null())]
 
+    albums_data = spotify.get_several_albums(headers, albums_to_scrape) #fetched in batch
+
     for album in albums_to_scrape:
 
         print(f"{album} album not in database")
 
-        data = spotify.get_album_info(headers,album)
-
-        album_dict = {}
-        album_dict['album_id'] = album
-        album_dict['name'] = data['name'].replace('%','')[0:100]
-        album_dict['type'] = data['type']
-        album_dict['popularity'] = data['popularity']
-        album_dict['release_date'] = data['release_date']
-        try:
-            album_dict['img_url'] = data.get('images')[0].get('url')
-        except IndexError:
-            album_dict['img_url'] = ''
-
-        mysql.insert_mysql('albums',album_dict)
+        if album not in albums_data:
+            print(f'{album} album data not found.')
+            continue
 
-        for artist in data['artists']:
-            mysql.insert_mysql('artist_album',{'artist_id' : artist['id'], 'album_id': album})
+        data = albums_data[album]
 
+        album_dict = get_info_album(album, data)
 
-def update_missing_artists(headers):
-    '''Checks if some artist is missing in table for some trailing error'''
+        with mysql.transaction():
+            mysql.insert_mysql('albums',album_dict)
+            mysql.insert_many('artist_album', [{'artist_id' : artist['id'], 'album_id': album} for artist in data['artists']])
 
 
-    artist_to_scrape = [artist[0] for artist in list(mysql.fetch_artist_in_songs_null())]
+def get_info_album(album_id, data):
+    '''
+    Returns album info in format to be inserted to database
+    Args:
+        album_id(str): album id
+        data(dict): raw data of album from spotify api
+    '''
 
-    for artist in artist_to_scrape:
-        print(f"{artist} artist not in database")
-        data = spotify.get_artist_info(artist, headers)
+    album_dict = {}
+    album_dict['album_id'] = album_id
+    album_dict['name'] = data['name'].replace('%','')[0:100]
+    album_dict['type'] = data['type']
+    album_dict['popularity'] = data['popularity']
+    album_dict['release_date'] = data['release_date']
+    try:
+        album_dict['img_url'] = data.get('images')[0].get('url')
+    except IndexError:
+        album_dict['img_url'] = ''
 
-        tmp_dict = {}
+    return album_dict
 
-        tmp_dict['artist_id'] = artist
-        tmp_dict['name'] = data['name'][0:100]
-        tmp_dict['popularity'] = data['popularity']
-        tmp_dict['followers'] = data['followers']['total']
 
-        try:
-            tmp_dict['img_url'] = data['images'][0]['url']
-        except IndexError:
-            tmp_dict['img_url'] = ''
+def update_missing_artists(headers, song_ids = None):
+    '''
+    Checks if some artist is missing in table for some trailing error
+    Args:
+        song_ids(list): only artists of these songs, e.g. just inserted. Whole songs table if None
+    '''
 
 
-        mysql.insert_mysql('artist', tmp_dict) #inserted into mysql table artist
-        data = spotify.get_artist_related(artist, headers).get('artists') #list of artist related
+    artist_to_scrape = [artist[0] for artist in list(mysql.fetch_artist_in_songs_null(song_ids)) if artist[0] is not None]
 
-        for element in data: #for each artist related
-            id_tmp = element['id']
-            tmp_dict = {'main_id': artist, 'rel_id': id_tmp}
-            mysql.insert_mysql('artist_rel', tmp_dict)
+    return insert_new_artists(headers, artist_to_scrape)
 
 
 
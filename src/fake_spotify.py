@@ -0,0 +1,422 @@
+'''
+Local stand in of Spotify API for offline load tests and benchmarks
+
+    python -m src.fake_spotify --port 8000 --latency 0.05 0.2 --rate-429 0.02
+    python -m src.fake_spotify --port 8000 --record ./data/replay     #proxies to real Spotify and saves responses
+    python -m src.fake_spotify --port 8000 --replay ./data/replay     #serves saved responses, synthetic data otherwise
+
+and then run the app against it with
+
+    SPOTIFY_API_URL=http://localhost:8000 SPOTIFY_ACCOUNTS_URL=http://localhost:8000 python app.py
+
+Catalog is synthetic and deterministic: same id always gives same track, artist or album,
+so related artists form a stable graph of FakeSpotifyVar.n_artists artists
+'''
+
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import struct
+import time
+import wave
+
+import requests
+from flask import Flask, request, jsonify, redirect, Response
+
+from src.variables import FakeSpotifyVar
+
+
+
+def _rng(*keys):
+    '''
+    Random generator seeded by keys, so synthetic entities do not change between requests
+    '''
+
+    seed = hashlib.md5('/'.join(str(key) for key in keys).encode()).hexdigest()
+
+    return random.Random(int(seed, 16))
+
+
+def _fake_id(prefix, num):
+
+    return f'{prefix}{num:018d}'[0:22]
+
+
+def _num_from_id(_id):
+
+    digits = ''.join(char for char in _id if char.isdigit())
+
+    return int(digits) if digits else int(hashlib.md5(_id.encode()).hexdigest(), 16)
+
+
+
+class FakeCatalog():
+    '''
+    Synthetic users, tracks, artists and albums
+    '''
+
+    def __init__(self, base_url, n_artists = FakeSpotifyVar.n_artists, n_tracks = FakeSpotifyVar.n_tracks):
+
+        self.base_url = base_url
+        self.n_artists = n_artists
+        self.n_tracks = n_tracks
+
+        self.playlists = {} #playlist id -> list of uris
+        self.following = {} #token -> set of user ids
+
+
+    def artist_id(self, num):
+        return _fake_id('ar', num % self.n_artists)
+
+    def track_id(self, num):
+        return _fake_id('tr', num % self.n_tracks)
+
+    def album_id(self, num):
+        return _fake_id('al', num)
+
+
+    def image(self, _id):
+        return [{'url': f'https://picsum.photos/seed/{_id}/300/300', 'height': 300, 'width': 300}]
+
+
+    def user(self, token):
+
+        rng = _rng('user', token)
+        user_id = f'fakeuser{rng.randint(0, 10 ** 6)}'
+
+        return {'id': user_id, 'display_name': f'Fake User {user_id[8:]}', 'country': rng.choice(FakeSpotifyVar.markets),
+                'followers': {'total': rng.randint(0, 500)}, 'images': self.image(user_id), 'type': 'user', 'uri': f'spotify:user:{user_id}'}
+
+
+    def artist(self, artist_id):
+
+        rng = _rng('artist', artist_id)
+
+        return {'id': artist_id, 'name': f'Artist {_num_from_id(artist_id)}', 'type': 'artist', 'uri': f'spotify:artist:{artist_id}',
+                'popularity': rng.randint(0, 100), 'followers': {'total': rng.randint(0, 10 ** 7)},
+                'genres': rng.sample(FakeSpotifyVar.genres, rng.randint(1, 3)), 'images': self.image(artist_id)}
+
+
+    def related_artists(self, artist_id):
+
+        rng = _rng('related', artist_id)
+        num = _num_from_id(artist_id)
+
+        #close neighbours keep graph connected, random ones make it small world
+        nums = [num + step for step in (1, -1, 2, -2)] + [rng.randint(0, self.n_artists - 1) for i in range(16)]
+
+        return {'artists': [self.artist(self.artist_id(item)) for item in nums if item % self.n_artists != num % self.n_artists]}
+
+
+    def album(self, album_id):
+
+        rng = _rng('album', album_id)
+        num = _num_from_id(album_id)
+
+        return {'id': album_id, 'name': f'Album {num}', 'type': 'album', 'album_type': 'album', 'uri': f'spotify:album:{album_id}',
+                'popularity': rng.randint(0, 100), 'release_date': f'{rng.randint(1960, 2021)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+                'images': self.image(album_id), 'artists': [self.simple_artist(self.artist_id(num))]}
+
+
+    def simple_artist(self, artist_id):
+
+        return {'id': artist_id, 'name': f'Artist {_num_from_id(artist_id)}', 'type': 'artist', 'uri': f'spotify:artist:{artist_id}'}
+
+
+    def track(self, track_id, market = None):
+
+        rng = _rng('track', track_id)
+        num = _num_from_id(track_id)
+
+        artist_nums = [num % self.n_artists] + [rng.randint(0, self.n_artists - 1) for i in range(rng.choice([0, 0, 0, 1]))]
+        album = self.album(self.album_id(num // 10))
+
+        #some tracks have preview only in a few markets, to exercise market probing
+        markets = FakeSpotifyVar.markets if rng.random() > FakeSpotifyVar.no_preview_rate else rng.sample(FakeSpotifyVar.markets, 2)
+        has_preview = market in markets if market is not None else markets is FakeSpotifyVar.markets
+
+        return {'id': track_id, 'name': f'Track {num}', 'type': 'track', 'uri': f'spotify:track:{track_id}',
+                'popularity': rng.randint(0, 100), 'duration_ms': rng.randint(120000, 360000), 'is_playable': True,
+                'preview_url': f'{self.base_url}/previews/{track_id}.mp3' if has_preview else None,
+                'album': {key: album[key] for key in ('id', 'name', 'type', 'album_type', 'uri', 'release_date', 'images')},
+                'artists': [self.simple_artist(self.artist_id(item)) for item in artist_nums]}
+
+
+    def top(self, token, kind, time_range, limit):
+
+        rng = _rng('top', token, kind, time_range)
+        size = self.n_tracks if kind == 'tracks' else self.n_artists
+        nums = rng.sample(range(size), min(limit, size))
+
+        if kind == 'tracks':
+            return {'items': [self.track(self.track_id(num)) for num in nums], 'total': len(nums), 'limit': limit, 'offset': 0, 'next': None}
+
+        return {'items': [self.artist(self.artist_id(num)) for num in nums], 'total': len(nums), 'limit': limit, 'offset': 0, 'next': None}
+
+
+    def playlist_page(self, playlist_id, offset, limit):
+
+        if playlist_id not in self.playlists: #unknown playlists get synthetic tracks, e.g. admin scraping playlists
+            rng = _rng('playlist', playlist_id)
+            self.playlists[playlist_id] = [f'spotify:track:{self.track_id(rng.randint(0, self.n_tracks - 1))}' for i in range(rng.randint(50, 400))]
+
+        uris = self.playlists[playlist_id]
+        items = [{'track': self.track(uri.split(':')[-1])} for uri in uris[offset:offset + limit]]
+        next_url = f'{self.base_url}/v1/playlists/{playlist_id}/tracks?offset={offset + limit}&limit={limit}' if offset + limit < len(uris) else None
+
+        return {'items': items, 'total': len(uris), 'offset': offset, 'limit': limit, 'next': next_url}
+
+
+
+class ReplayStore():
+    '''
+    Responses saved on disk, one json file per request
+    '''
+
+    def __init__(self, path):
+
+        self.path = path
+        os.makedirs(path, exist_ok = True)
+
+
+    def key(self, method, path, args):
+
+        query = '&'.join(f'{key}={value}' for key, value in sorted(args.items(multi = True)))
+
+        return hashlib.sha1(f'{method} {path}?{query}'.encode()).hexdigest()
+
+
+    def get(self, key):
+
+        file_path = os.path.join(self.path, f'{key}.json')
+
+        if not os.path.exists(file_path):
+            return None
+
+        with open(file_path) as f:
+            return json.load(f)
+
+
+    def set(self, key, status, body):
+
+        with open(os.path.join(self.path, f'{key}.json'), 'w') as f:
+            json.dump({'status': status, 'body': body}, f)
+
+
+
+def synthetic_preview(track_id, seconds = FakeSpotifyVar.preview_seconds, sample_rate = FakeSpotifyVar.preview_sample_rate):
+    '''
+    Generates a short audio clip for a track: a few tones derived from its id.
+    Returned as wav, librosa reads it by content whatever the extension
+    '''
+
+    rng = _rng('preview', track_id)
+    freqs = [rng.uniform(110, 880) for i in range(3)]
+
+    samples = bytearray()
+    for i in range(int(seconds * sample_rate)):
+        value = sum(math.sin(2 * math.pi * freq * i / sample_rate) for freq in freqs) / len(freqs)
+        samples += struct.pack('<h', int(value * 12000))
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(bytes(samples))
+
+    return buffer.getvalue()
+
+
+
+def create_app(base_url, latency = FakeSpotifyVar.latency, rate_429 = FakeSpotifyVar.rate_429, record = None, replay = None):
+    '''
+    Creates fake Spotify server
+    Args:
+        base_url(str): url where server is reachable, used in next links and preview urls
+        latency(tuple): min and max seconds added to every response
+        rate_429(float): share of api requests answered with 429 Too Many Requests
+        record(str): folder to save responses of real Spotify, server works as a proxy
+        replay(str): folder with saved responses, served instead of synthetic ones when found
+    Returns:
+        app: flask app
+    '''
+
+    app = Flask(__name__)
+
+    catalog = FakeCatalog(base_url)
+    store = ReplayStore(record or replay) if (record or replay) else None
+    previews = {}
+
+
+    def token():
+        return request.headers.get('Authorization', 'Bearer anonymous').split(' ')[-1]
+
+
+    @app.before_request
+    def simulate_network():
+
+        time.sleep(random.uniform(*latency))
+
+        if request.path.startswith('/v1/') and random.random() < rate_429:
+            return Response(status = 429, headers = {'Retry-After': str(FakeSpotifyVar.retry_after)})
+
+        if store is None:
+            return None
+
+        key = store.key(request.method, request.path, request.args)
+
+        if record is not None:
+            upstream = FakeSpotifyVar.upstream_accounts if request.path.startswith('/api/') or request.path == '/authorize' else FakeSpotifyVar.upstream_api
+            headers = {name: value for name, value in request.headers.items() if name.lower() in ('authorization', 'content-type')}
+
+            r = requests.request(request.method, f'{upstream}{request.path}', params = request.args, headers = headers,
+                                data = request.get_data(), allow_redirects = False)
+
+            body = r.json() if 'json' in r.headers.get('Content-Type', '') else None
+            if body is not None and request.path != '/api/token': #tokens are not saved
+                store.set(key, r.status_code, body)
+
+            return Response(r.content, status = r.status_code, headers = {name: value for name, value in r.headers.items() if name.lower() in ('content-type', 'location', 'retry-after')})
+
+        saved = store.get(key)
+        if saved is not None:
+            return jsonify(saved['body']), saved['status']
+
+        return None
+
+
+    @app.route('/authorize')
+    def authorize():
+        return redirect(f"{request.args.get('redirect_uri')}?code=fake-{random.randint(0, 10 ** 9)}")
+
+    @app.route('/api/token', methods = ['POST'])
+    def get_token():
+        data = request.form
+        refresh_token = data.get('refresh_token') or f"refresh-{data.get('code', 'fake')}"
+        return jsonify({'access_token': f'access-{refresh_token}', 'token_type': 'Bearer', 'expires_in': FakeSpotifyVar.token_expires_in, 'refresh_token': refresh_token})
+
+
+    @app.route('/v1/me')
+    def me():
+        return jsonify(catalog.user(token()))
+
+    @app.route('/v1/me/top/<kind>')
+    def top(kind):
+        return jsonify(catalog.top(token(), kind, request.args.get('time_range', 'medium_term'), int(request.args.get('limit', 20))))
+
+
+    @app.route('/v1/tracks/<track_id>')
+    def track(track_id):
+        return jsonify(catalog.track(track_id, request.args.get('market')))
+
+    @app.route('/v1/tracks')
+    def tracks():
+        return jsonify({'tracks': [catalog.track(_id, request.args.get('market')) for _id in request.args.get('ids', '').split(',') if _id]})
+
+
+    @app.route('/v1/artists/<artist_id>')
+    def artist(artist_id):
+        return jsonify(catalog.artist(artist_id))
+
+    @app.route('/v1/artists')
+    def artists():
+        return jsonify({'artists': [catalog.artist(_id) for _id in request.args.get('ids', '').split(',') if _id]})
+
+    @app.route('/v1/artists/<artist_id>/related-artists')
+    def related_artists(artist_id):
+        return jsonify(catalog.related_artists(artist_id))
+
+    @app.route('/v1/artists/<artist_id>/top-tracks')
+    def artist_top_tracks(artist_id):
+        num = _num_from_id(artist_id)
+        return jsonify({'tracks': [catalog.track(catalog.track_id(num + i * catalog.n_artists)) for i in range(10)]})
+
+
+    @app.route('/v1/albums/<album_id>')
+    def album(album_id):
+        return jsonify(catalog.album(album_id))
+
+    @app.route('/v1/albums')
+    def albums():
+        return jsonify({'albums': [catalog.album(_id) for _id in request.args.get('ids', '').split(',') if _id]})
+
+
+    @app.route('/v1/users/<user_id>/playlists', methods = ['POST'])
+    def create_playlist(user_id):
+        playlist_id = _fake_id('pl', random.randint(0, 10 ** 12))
+        catalog.playlists[playlist_id] = []
+        return jsonify({'id': playlist_id, 'name': (request.get_json(silent = True) or {}).get('name'), 'owner': {'id': user_id},
+                        'external_urls': {'spotify': f'{base_url}/playlist/{playlist_id}'}}), 201
+
+    @app.route('/v1/playlists/<playlist_id>/tracks', methods = ['GET'])
+    def playlist_tracks(playlist_id):
+        return jsonify(catalog.playlist_page(playlist_id, int(request.args.get('offset', 0)), min(int(request.args.get('limit', 100)), 100)))
+
+    @app.route('/v1/playlists/<playlist_id>/tracks', methods = ['POST'])
+    def add_playlist_tracks(playlist_id):
+        data = request.get_json(silent = True) or {}
+        uris = data.get('uris', [])
+        playlist = catalog.playlists.setdefault(playlist_id, [])
+        position = data.get('position', len(playlist))
+
+        if len(uris) > 100:
+            return jsonify({'error': {'status': 400, 'message': 'You can add a maximum of 100 tracks per request.'}}), 400
+        if position > len(playlist):
+            return jsonify({'error': {'status': 400, 'message': 'Index out of bounds'}}), 400
+
+        playlist[position:position] = uris
+        return jsonify({'snapshot_id': hashlib.sha1(json.dumps(playlist).encode()).hexdigest()}), 201
+
+
+    @app.route('/v1/me/following/contains')
+    def following_contains():
+        following = catalog.following.get(token(), set())
+        return jsonify([_id in following for _id in request.args.get('ids', '').split(',') if _id])
+
+    @app.route('/v1/me/following', methods = ['PUT', 'DELETE'])
+    def follow():
+        following = catalog.following.setdefault(token(), set())
+        for _id in request.args.get('ids', '').split(','):
+            if request.method == 'PUT':
+                following.add(_id)
+            else:
+                following.discard(_id)
+        return '', 204
+
+
+    @app.route('/previews/<track_id>.mp3')
+    def preview(track_id):
+        if track_id not in previews:
+            previews[track_id] = synthetic_preview(track_id)
+        return Response(previews[track_id], mimetype = 'audio/wav')
+
+
+    return app
+
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Local stand in of Spotify API')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8000)
+    parser.add_argument('--latency', type = float, nargs = 2, default = FakeSpotifyVar.latency, help = 'min and max seconds added to every response')
+    parser.add_argument('--rate-429', type = float, default = FakeSpotifyVar.rate_429, help = 'share of api requests answered with 429')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', help = 'folder to save real Spotify responses, server proxies requests')
+    group.add_argument('--replay', help = 'folder with saved responses to serve')
+
+    args = parser.parse_args()
+
+    app = create_app(f'http://{args.host}:{args.port}', tuple(args.latency), args.rate_429, args.record, args.replay)
+    app.run(host = args.host, port = args.port, threaded = True)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+import threading
+import time
+
+import requests
+
+import src.spotify as spotify
+from src.variables import FollowVar
+
+
+
+class FollowState():
+    '''
+    Whether viewer follows other users on Spotify, cached per viewer during a short ttl.
+    Missing users are checked in batches of 50 and follow/unfollow update cache instead of checking again.
+    Expired entries and viewers left without entries are swept on writes, at most once per ttl, and each viewer
+    keeps at most max_per_viewer users
+    '''
+
+    def __init__(self, ttl = FollowVar.ttl, chunk_size = FollowVar.chunk_size, max_per_viewer = FollowVar.max_per_viewer):
+
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.max_per_viewer = max_per_viewer
+
+        self._cache = {} #viewer -> {user_id: (following, expires)}
+        self._lock = threading.Lock()
+        self._swept = time.time()
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+
+    def statuses(self, headers, viewer, user_ids):
+        '''
+        Follow state of several users
+        Args:
+            headers(dict): headers for spotify api of viewer
+            viewer(str): user id of viewer
+            user_ids(list): user ids to check
+        Returns:
+            following(dict): keys are user ids, values True if viewer follows them.
+            False if unknown, e.g. Spotify answered with an error, and not cached
+        '''
+
+        now = time.time()
+        following = {}
+
+        with self._lock:
+            cached = self._cache.get(viewer, {})
+
+            for user_id in user_ids:
+                item = cached.get(user_id)
+                if item is not None and item[1] > now:
+                    following[user_id] = item[0]
+
+            self.hits += len(following)
+
+        missing = list(dict.fromkeys(user_id for user_id in user_ids if user_id not in following))
+
+        if len(missing) == 0:
+            return following
+
+        chunks = [missing[i:i + self.chunk_size] for i in range(0, len(missing), self.chunk_size)]
+        results = spotify.client.gather(*[(_check_follow, headers, chunk) for chunk in chunks])
+
+        with self._lock:
+            self.misses += len(missing)
+            cached = self._cache.setdefault(viewer, {})
+
+            for chunk, result in zip(chunks, results):
+
+                if not isinstance(result, list) or len(result) != len(chunk): #error body, e.g. {'error': {...}}
+                    self.errors += 1
+                    following.update((user_id, False) for user_id in chunk)
+                    continue
+
+                for user_id, state in zip(chunk, result): #same order as requested
+                    following[user_id] = state
+                    cached[user_id] = (state, now + self.ttl)
+
+            self._trim(viewer, now)
+
+        return following
+
+
+    def is_following(self, headers, viewer, user_id):
+
+        return self.statuses(headers, viewer, [user_id])[user_id]
+
+
+    def follow(self, headers, viewer, user_id):
+
+        r = spotify.follow_user(headers, user_id)
+        self._update(viewer, user_id, True, r)
+
+        return r
+
+
+    def unfollow(self, headers, viewer, user_id):
+
+        r = spotify.unfollow_user(headers, user_id)
+        self._update(viewer, user_id, False, r)
+
+        return r
+
+
+    def stats(self):
+
+        with self._lock:
+            return {'viewers': len(self._cache), 'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
+
+
+    def _update(self, viewer, user_id, state, r):
+
+        with self._lock:
+            cached = self._cache.setdefault(viewer, {})
+
+            if r.status_code in range(200, 299):
+                cached[user_id] = (state, time.time() + self.ttl)
+            else:
+                cached.pop(user_id, None) #unknown, checked again next time
+
+            self._trim(viewer, time.time())
+
+
+    def _trim(self, viewer, now):
+        '''
+        Bounds entries of viewer just written and sweeps expired entries of all viewers once per ttl. Called with lock held
+        '''
+
+        cached = self._cache.get(viewer, {})
+
+        if len(cached) > self.max_per_viewer: #drops first to expire
+            for user_id in sorted(cached, key = lambda user_id: cached[user_id][1])[:len(cached) - self.max_per_viewer]:
+                del cached[user_id]
+
+        if now - self._swept < self.ttl:
+            return
+
+        self._swept = now
+
+        for viewer_id in list(self._cache):
+            cached = self._cache[viewer_id]
+
+            for user_id in [user_id for user_id, item in cached.items() if item[1] <= now]:
+                del cached[user_id]
+
+            if len(cached) == 0:
+                del self._cache[viewer_id]
+
+
+
+def _check_follow(headers, user_ids):
+    '''
+    check_follow returning None if request failed or body is not json, so other chunks are still used
+    '''
+
+    try:
+        return spotify.check_follow(headers, user_ids)
+    except (requests.RequestException, ValueError):
+        return None
+
+
+
+follows = FollowState()
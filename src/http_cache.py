@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import threading
+import time
+
+from src.variables import HttpCacheVar
+
+
+
+class HttpCache():
+    '''
+    On disk cache of Spotify metadata responses (artists, albums, related artists...),
+    keyed by endpoint and id. Entries expire with a ttl per resource, may be revalidated with
+    their ETag and the least recently used ones are evicted above max_bytes. Access times are kept in memory
+    and written in batches, lookups do not write
+    '''
+
+    def __init__(self, path = HttpCacheVar.path, max_bytes = HttpCacheVar.max_bytes, ttls = HttpCacheVar.ttl):
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+
+        self._lock = threading.Lock()
+        self._conn = None #opened on first use, not at import
+        self._size = 0 #bytes of all bodies, read when opened and kept up to date
+        self._accessed = {} #key -> access time not written yet
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stores = 0
+        self.evictions = 0
+
+
+    @property
+    def _db(self):
+        '''
+        Connection to cache database, opened on first use creating its folder if needed. Used with lock held
+        '''
+
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok = True)
+
+            conn = sqlite3.connect(self.path, check_same_thread = False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, resource TEXT, body TEXT, etag TEXT, expires REAL, accessed REAL, size INTEGER)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_accessed ON responses (accessed)')
+            conn.commit()
+
+            self._size = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            self._conn = conn
+
+        return self._conn
+
+
+    def get(self, key):
+        '''
+        Looks up a response
+        Args:
+            key(str): endpoint and id, e.g. 'artists/<id>/related-artists'
+        Returns:
+            body(str): cached body, None if not cached
+            etag(str): etag of cached body, to revalidate if stale
+            fresh(bool): True if body can be used without revalidation
+        '''
+
+        with self._lock:
+            row = self._db.execute('SELECT body, etag, expires FROM responses WHERE key = ?', (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None, None, False
+
+            body, etag, expires = row
+            now = time.time()
+            self._accessed[key] = now
+
+            if len(self._accessed) >= HttpCacheVar.access_batch:
+                self._flush_accessed()
+                self._db.commit()
+
+            if expires >= now:
+                self.hits += 1
+                return body, etag, True
+
+            self.misses += 1
+            return body, etag, False
+
+
+    def set(self, key, resource, body, etag = None):
+        '''
+        Saves response body
+        Args:
+            key(str): endpoint and id
+            resource(str): type of resource, to pick ttl
+            body(str): response body
+            etag(str): ETag header of response, if any
+        '''
+
+        now = time.time()
+        expires = now + self.ttls.get(resource, HttpCacheVar.default_ttl)
+
+        with self._lock:
+            old = self._db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)', (key, resource, body, etag, expires, now, len(body)))
+            self._accessed.pop(key, None)
+            self._size += len(body) - (old[0] if old is not None else 0)
+            self.stores += 1
+
+            if self._size > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+
+    def revalidate(self, key, resource):
+        '''
+        Extends ttl of an entry after a 304 Not Modified response
+        '''
+
+        expires = time.time() + self.ttls.get(resource, HttpCacheVar.default_ttl)
+
+        with self._lock:
+            self._db.execute('UPDATE responses SET expires = ? WHERE key = ?', (expires, key))
+            self._db.commit()
+            self.revalidated += 1
+
+
+    def stats(self):
+
+        with self._lock:
+            entries = self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            lookups = self.hits + self.misses
+
+            return {'entries': entries, 'bytes': self._size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                    'revalidated': self.revalidated, 'stores': self.stores, 'evictions': self.evictions}
+
+
+    def _flush_accessed(self):
+        '''
+        Writes pending access times in one statement batch. Called with lock held, commit left to caller
+        '''
+
+        self._db.executemany('UPDATE responses SET accessed = ? WHERE key = ?', [(accessed, key) for key, accessed in self._accessed.items()])
+        self._accessed.clear()
+
+
+    def _evict(self):
+        '''
+        Deletes least recently used entries until size is below max_bytes. Called with lock held
+        '''
+
+        self._flush_accessed() #recent lookups count before picking entries
+
+        while self._size > self.max_bytes:
+            rows = self._db.execute('SELECT key, size FROM responses ORDER BY accessed LIMIT 100').fetchall()
+
+            if len(rows) == 0:
+                break
+
+            for key, row_size in rows:
+                self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.evictions += 1
+                self._size -= row_size
+
+                if self._size <= self.max_bytes:
+                    break
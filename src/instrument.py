@@ -0,0 +1,153 @@
+import contextvars
+import logging
+import re
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from src.variables import ProfilerVar
+
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('query_profile', default = None)
+
+
+
+class QueryProfile():
+    '''
+    Queries executed during one request or job
+    '''
+
+    def __init__(self, name):
+
+        self.name = name
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest = [] #(elapsed, query)
+        self.shapes = Counter()
+        self._lock = threading.Lock() #async workers record from other threads
+
+
+    def record(self, query, elapsed):
+
+        with self._lock:
+            self.count += 1
+            self.total_time += elapsed
+            self.shapes[query_shape(query)] += 1
+
+            self.slowest.append((elapsed, query))
+            self.slowest = sorted(self.slowest, reverse = True)[:ProfilerVar.slowest]
+
+
+    def summary(self, threshold = ProfilerVar.n_plus_one_threshold):
+        '''
+        Returns summary of profile
+        Args:
+            threshold(int): times a query shape has to be repeated to be flagged as N+1
+        '''
+
+        with self._lock:
+            repeated = [{'shape': shape, 'count': count} for shape, count in self.shapes.most_common() if count >= threshold]
+
+            return {'name': self.name,
+                    'count': self.count,
+                    'total_ms': round(self.total_time * 1000, 2),
+                    'slowest': [{'ms': round(elapsed * 1000, 2), 'shape': query_shape(query)[0:300]} for elapsed, query in self.slowest], #no literals, e.g. user ids
+                    'n_plus_one': repeated}
+
+
+
+class QueryProfiler():
+    '''
+    Collects per request/job query statistics and keeps last summaries for metrics endpoint
+    '''
+
+    def __init__(self, history = ProfilerVar.history):
+
+        self.history = deque(maxlen = history)
+
+
+    def start(self, name):
+        '''
+        Starts profiling of queries in current context
+        Args:
+            name(str): request or job name
+        Returns:
+            token to be given to finish
+        '''
+
+        return _current.set(QueryProfile(name))
+
+
+    def finish(self, token):
+        '''
+        Finishes profile started with token, logs summary and saves it in history
+        '''
+
+        profile = _current.get()
+
+        try:
+            _current.reset(token)
+        except ValueError: #token created in another context
+            _current.set(None)
+
+        if profile is None:
+            return None
+
+        summary = profile.summary()
+        self.history.append(summary)
+
+        logger.info(f"{summary['name']}: {summary['count']} queries in {summary['total_ms']} ms")
+
+        for item in summary['n_plus_one']:
+            logger.warning(f"{summary['name']}: possible N+1, query repeated {item['count']} times: {item['shape'][0:200]}")
+
+        return summary
+
+
+    @contextmanager
+    def profile(self, name):
+        '''
+        Profiles queries of a block, e.g. admin jobs
+        '''
+
+        token = self.start(name)
+        try:
+            yield
+        finally:
+            self.finish(token)
+
+
+    def record(self, query, elapsed):
+        '''
+        Records executed query in profile of current context, if any
+        '''
+
+        profile = _current.get()
+
+        if profile is not None:
+            profile.record(query, elapsed)
+
+
+    def summaries(self):
+
+        return list(self.history)
+
+
+
+def query_shape(query):
+    '''
+    Normalizes query replacing literals, so same queries with different values have same shape
+    '''
+
+    shape = re.sub(r"'(?:[^'\\]|\\.)*'", '?', query)
+    shape = re.sub(r'"(?:[^"\\]|\\.)*"', '?', shape)
+    shape = re.sub(r'\b\d+(\.\d+)?\b', '?', shape)
+    shape = re.sub(r'\(\s*\?(\s*,\s*\?)*\s*\)', '(?)', shape) #IN lists and VALUES
+
+    return ' '.join(shape.split())
+
+
+
+profiler = QueryProfiler()
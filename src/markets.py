@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import threading
+import time
+
+from src.variables import MarketVar
+
+
+
+class MarketHints():
+    '''
+    Remembers in which markets previews were found, per album and per artist,
+    and which songs have no preview in any market, so later probes try likely markets first
+    or are skipped
+    '''
+
+    def __init__(self, path = MarketVar.path):
+
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._conn = None #opened on first use, not at import
+
+
+    @property
+    def _db(self):
+        '''
+        Connection to hints database, opened on first use creating its folder if needed. Used with lock held
+        '''
+
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok = True)
+
+            conn = sqlite3.connect(self.path, check_same_thread = False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS hints (kind TEXT, key TEXT, market TEXT, hits INTEGER, PRIMARY KEY (kind, key, market))')
+            conn.execute('CREATE TABLE IF NOT EXISTS dead (song_id TEXT PRIMARY KEY, until REAL)')
+            conn.commit()
+
+            self._conn = conn
+
+        return self._conn
+
+
+    def rank(self, markets, album_id = None, artist_ids = ()):
+        '''
+        Sorts markets with the ones that worked for album first, then for artists, then the rest in original order
+        Args:
+            markets(list): list of market codes
+            album_id(str): album of song
+            artist_ids(list): artists of song
+        Returns:
+            markets(list): sorted markets
+        '''
+
+        scores = {}
+
+        with self._lock:
+            if album_id is not None:
+                for market, hits in self._db.execute("SELECT market, hits FROM hints WHERE kind = 'album' AND key = ?", (album_id,)):
+                    scores[market] = scores.get(market, 0) + hits * MarketVar.album_weight
+
+            for artist_id in artist_ids:
+                for market, hits in self._db.execute("SELECT market, hits FROM hints WHERE kind = 'artist' AND key = ?", (artist_id,)):
+                    scores[market] = scores.get(market, 0) + hits
+
+        return sorted(markets, key = lambda market: -scores.get(market, 0)) #stable, original order kept for ties
+
+
+    def record_found(self, market, album_id = None, artist_ids = ()):
+
+        keys = [('artist', artist_id) for artist_id in artist_ids]
+        if album_id is not None:
+            keys.append(('album', album_id))
+
+        with self._lock:
+            for kind, key in keys:
+                self._db.execute('INSERT OR IGNORE INTO hints VALUES (?, ?, ?, 0)', (kind, key, market))
+                self._db.execute('UPDATE hints SET hits = hits + 1 WHERE kind = ? AND key = ? AND market = ?', (kind, key, market))
+            self._db.commit()
+
+
+    def record_dead(self, song_id):
+        '''
+        Song without preview in any market. Skipped during MarketVar.dead_ttl
+        '''
+
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO dead VALUES (?, ?)', (song_id, time.time() + MarketVar.dead_ttl))
+            self._db.commit()
+
+
+    def is_dead(self, song_id):
+
+        with self._lock:
+            row = self._db.execute('SELECT until FROM dead WHERE song_id = ?', (song_id,)).fetchone()
+
+        return row is not None and row[0] > time.time()
@@ -1,51 +1,501 @@
-import networkx as nx
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from src.artist_graph import ArtistGraph
 from src.variables import Community
-import pandas as pd
 from src.mysql import mysql as mysql
 
 
+_pending = set() #artists inserted in this process and not yet applied to graph on disk
+_pending_lock = threading.Lock()
 
-def create_community():
 
-    df_comm = pd.DataFrame(mysql.fetch_community(), columns = ['artist1', 'artist2'])
-    G = nx.from_pandas_edgelist(df_comm,  source='artist1', target='artist2')
 
-    nx.write_gpickle(G, Community.path_G)
+class ReferenceDistances():
+    '''
+    Distances and shortest paths from every artist to a reference artist, from a single BFS.
+    Stored as arrays indexed by artist index, lookups do not search graph again
+    '''
 
-    return df_comm
+    def __init__(self, G, ref_artist):
 
+        self.G = G
+        self.ref_artist = ref_artist
+        self.index = G.index #artist id -> index
 
+        source = G.resolve(ref_artist) #configured artists may be given by name
 
-def load_community(path = Community.path_G):
+        if source is None:
+            self.distance = np.full(G.number_of_nodes(), -1, dtype = np.int32) #-1 not connected
+            self.predecessor = np.full(G.number_of_nodes(), -1, dtype = np.int32)
+        else:
+            self.distance, self.predecessor = G.bfs(source) #predecessor is next artist towards reference artist
+
+
+    def distance_to(self, artist_id):
+        '''
+        Returns distance of artist to reference artist, Community.penalty_not_path if not connected
+        '''
+
+        item = self.index.get(artist_id)
+
+        if item is None or self.distance[item] == -1:
+            return Community.penalty_not_path ##penalty for not having connection
+
+        return int(self.distance[item])
+
+
+    def path_to(self, artist_id):
+        '''
+        Returns shortest path of artist ids from artist to reference artist, both included. Empty if not connected
+        '''
+
+        item = self.index.get(artist_id)
+
+        if item is None or self.distance[item] == -1:
+            return []
+
+        path = [item]
+        while self.predecessor[path[-1]] != -1:
+            path.append(int(self.predecessor[path[-1]]))
+
+        return [self.G.ids[node] for node in path]
+
+
+
+class CommunityGraph():
+    '''
+    Artists community shared by all threads of process. Loaded once and, when version on disk changes,
+    only edges appended to log since last read are added. Graph file is read again only after a compaction.
+    Graph given to readers is never modified, updates replace it
+    '''
+
+    def __init__(self, check_interval = Community.version_check_interval):
+
+        self.check_interval = check_interval
+
+        self.G = None
+        self.version = None
+        self.stamp = None #graph file G was loaded from
+        self.offset = 0 #bytes of edges log already in G
+        self.checked = 0 #time version on disk was last checked
+        self.references = {} #reference artist -> ReferenceDistances of current version
+        self._lock = threading.RLock()
+
+        self.loads = 0
+
+
+    def get(self, force = False):
+        '''
+        Args:
+            force(bool): check version on disk now, e.g. after this process appended edges
+        Returns:
+            G: current artists community
+        '''
+
+        now = time.monotonic()
+
+        if not force and self.G is not None and now - self.checked < self.check_interval:
+            return self.G
+
+        with self._lock:
+            version = community_version()
+            self.checked = now
+
+            if not os.path.exists(Community.path_G): #first run
+                create_community()
+
+            elif self.G is None or version != self.version:
+                self._reload(version)
+
+            return self.G
+
+
+    def set(self, G, stamp):
+        '''
+        Replaces graph after this process compacted it, no need to read it again. Edges log was emptied
+        Args:
+            stamp(tuple): stamp of graph file saved, see graph_stamp
+        '''
+
+        with self._lock:
+            self._replace(G, G.version)
+            self.stamp = stamp
+            self.offset = 0
+            self.checked = time.monotonic()
+
+
+    def _reload(self, version):
+        '''
+        Adds edges appended to log since last read or, if graph file was compacted meanwhile, loads it again.
+        Graph file is checked before and after reading, a compaction in the middle means reading again
+        '''
+
+        while True:
+            stamp = graph_stamp()
+
+            if self.G is not None and stamp == self.stamp:
+                G, offset = self.G, self.offset
+            else:
+                G, offset = ArtistGraph.load(Community.path_G), 0
+
+            rows, offset = read_edges(offset)
+
+            if graph_stamp() == stamp:
+                break
+
+        full = G is not self.G
+
+        if len(rows) > 0:
+            G = G.add_edges(rows) #new graph, graph of readers is not modified
+        G.version = version
 
-    G = nx.read_gpickle(path)
+        self._replace(G, version)
+        self.stamp = stamp
+        self.offset = offset
+
+        if full:
+            self.loads += 1
+
+
+    def reference(self, ref_artist = Community.artist_ref_distance):
+        '''
+        Returns ReferenceDistances of an artist for current graph, computed once per version
+        '''
+
+        with self._lock:
+            G = self.get()
+
+            if ref_artist not in self.references:
+                self.references[ref_artist] = ReferenceDistances(G, ref_artist)
+
+            return self.references[ref_artist]
+
+
+    def sources(self, artist_ids):
+        '''
+        Returns ReferenceDistances from several artists of current graph, not cached. Artists not in graph are left out
+        '''
+
+        G = self.get()
+
+        return [ReferenceDistances(G, artist_id) for artist_id in artist_ids if G.has_node(artist_id)]
+
+
+    def _replace(self, G, version):
+
+        self.G = G
+        self.version = version
+        self.references = {}
+
+        for ref_artist in Community.reference_artists: #configured ones ready before first request
+            self.references[ref_artist] = ReferenceDistances(G, ref_artist)
+
+
+    def stats(self):
+
+        with self._lock:
+            return {'version': self.version, 'loads': self.loads, 'log_bytes': self.offset,
+                    'nodes': self.G.number_of_nodes() if self.G is not None else 0,
+                    'edges': self.G.number_of_edges() if self.G is not None else 0}
+
+
+
+@contextmanager
+def community_lock(path = Community.path_lock):
+    '''
+    Exclusive lock on graph on disk, between threads and processes updating it
+    '''
+
+    with open(path, 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+
+def create_community():
+    '''
+    Full rebuild of graph from artist_rel table. Offline compaction, see manage.py compact-graph.
+    Edges in log are in artist_rel too, log is emptied
+    '''
+
+    with community_lock(): #no incremental update lost while rebuilding
+
+        G = build_community()
+
+        save_community(G, community_version() + 1)
+
+        stamp = graph_stamp()
+
+    community.set(G, stamp)
 
     return G
 
 
-def shortest_path_len(G, main_artist, ref_artist = Community.artist_ref_distance):
+
+def build_community():
+
+    return ArtistGraph.from_edges(mysql.iter_community()) #streamed in chunks, no full edge list in memory
+
+
+
+def save_community(G, version, path = Community.path_G):
+    '''
+    Saves graph, empties edges log and saves version. Graph file is replaced atomically before log is emptied,
+    so readers of log notice the compaction
+    '''
+
+    G.version = version
+
+    G.save(path)
+
+    open(Community.path_log, 'w').close()
+
+    write_version(version)
+
+
+
+def write_version(version):
+
+    with open(f'{Community.path_version}.tmp', 'w') as f:
+        f.write(str(version))
+    os.replace(f'{Community.path_version}.tmp', Community.path_version)
+
+
+
+def graph_stamp(path = Community.path_G):
+    '''
+    Identifies graph file on disk, it changes when graph is compacted (file replaced)
+    '''
+
+    stat = os.stat(path)
+
+    return stat.st_ino, stat.st_mtime_ns
+
+
+
+def append_edges(rows, path = Community.path_log):
+    '''
+    Appends edges to log of graph on disk, one line per edge. Log is folded into graph file by compact-graph
+    Args:
+        rows(list): rows (artist id, artist name, related id, related name)
+    '''
+
+    lines = ''.join('\t'.join(str(value).replace('\t', ' ').replace('\n', ' ') for value in row) + '\n' for row in rows)
+
+    with open(path, 'a') as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+
+def read_edges(offset = 0, path = Community.path_log):
+    '''
+    Reads edges appended to log
+    Args:
+        offset(int): bytes already read
+    Returns:
+        rows(list): rows (artist id, artist name, related id, related name)
+        offset(int): bytes read, a line still being written is left for next time
+    '''
 
     try:
-        return nx.shortest_path_length(G, source = main_artist,target = ref_artist)
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
 
-    except:
-        return Community.penalty_not_path ##penalty for not having connection
+    end = data.rfind(b'\n') + 1
+
+    rows = [tuple(line.split('\t')) for line in data[:end].decode().splitlines()]
+
+    return rows, offset + end
+
+
+
+def community_version():
+    '''
+    Version of graph on disk, 0 if never created
+    '''
+
+    try:
+        with open(Community.path_version) as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+
+def record_new_artists(artist_ids):
+    '''
+    Remembers artists inserted during ingestion, their edges are added to graph by apply_new_artists
+    '''
+
+    with _pending_lock:
+        _pending.update(artist_ids)
+
+
+
+def apply_new_artists():
+    '''
+    Appends to edges log on disk only the edges of artists recorded since last call, instead of rewriting
+    the graph file. Graph in memory gets them from log
+    Returns:
+        version(int): version of graph on disk
+    '''
+
+    with _pending_lock:
+        artist_ids = list(_pending)
+        _pending.clear()
+
+    if len(artist_ids) == 0:
+        return community_version()
+
+    try:
+        if not os.path.exists(Community.path_G): #first run, whole graph built with new artists
+            return create_community().version
+
+        rows = [tuple(row) for row in mysql.fetch_community_edges(artist_ids)]
+
+        if len(rows) == 0:
+            return community_version()
+
+        with community_lock():
+            append_edges(rows)
+            write_version(community_version() + 1)
+
+    except Exception:
+        record_new_artists(artist_ids) #applied next time
+        raise
 
+    return community.get(force = True).version
 
 
-    
 
+def users_distances(main_artists, users_artists):
+    '''
+    Distances between artists of main user and artists of other users. One BFS per artist of main user
+    answers all artists of all users, instead of a search per pair of artists
+    Args:
+        main_artists(list): artist ids of main user
+        users_artists(dict): keys are user ids, values lists of artist ids
+    Returns:
+        distances(dict): keys are user ids, values (avg_distance, min_distance, min_path)
+    '''
 
+    sources = community.sources(main_artists)
+
+    distances = {}
+
+    if len(sources) > 0:
+        matrix = np.stack([source.distance for source in sources]) #artists of main user x all artists
+        matrix = np.where(matrix == -1, Community.penalty_not_path, matrix) ##penalty for not having connection
+        index = sources[0].index
+
+    for user, artists in users_artists.items():
+
+        targets = [index[artist] for artist in artists if artist in index] if len(sources) > 0 else []
+
+        if len(targets) == 0:
+            distances[user] = (np.nan, 100000, []) #dummy large value
+            continue
+
+        pairs = matrix[:, targets]
+
+        source, target = np.unravel_index(np.argmin(pairs), pairs.shape) #first minimum, same order as artists
+        min_distance = int(pairs[source, target])
+        min_path = sources[source].path_to(sources[source].G.ids[targets[target]])[::-1] #from artist of main user
+
+        distances[user] = (round(float(np.mean(pairs)), 1), min_distance, min_path)
+
+    return distances
+
+
+
+def pair_distances(main_artists, artists):
+    '''
+    Distances between artists of main user and artists of a single other user, same result as users_distances.
+    One bidirectional search per pair of artists, cheaper than a full BFS per artist of main user when only
+    one user is compared
+    Args:
+        main_artists(list): artist ids of main user
+        artists(list): artist ids of other user
+    Returns:
+        distance(tuple): (avg_distance, min_distance, min_path)
+    '''
+
+    G = community.get()
+
+    sources = [G.index[artist] for artist in main_artists if artist in G.index]
+    targets = [G.index[artist] for artist in artists if artist in G.index]
+
+    if len(sources) == 0 or len(targets) == 0:
+        return (np.nan, 100000, []) #dummy large value
+
+    paths = {} #pair of indices -> path, artists may be repeated
+    pairs = np.empty((len(sources), len(targets)), dtype = np.int32)
+
+    for i, source in enumerate(sources):
+        for j, target in enumerate(targets):
+
+            if (source, target) not in paths:
+                paths[(source, target)] = G.shortest_path(source, target)
+
+            path = paths[(source, target)]
+            pairs[i, j] = len(path) - 1 if len(path) > 0 else Community.penalty_not_path ##penalty for not having connection
+
+    source, target = np.unravel_index(np.argmin(pairs), pairs.shape) #first minimum, same order as artists
+    min_path = [G.ids[item] for item in paths[(sources[source], targets[target])]] #from artist of main user
+
+    return (round(float(np.mean(pairs)), 1), int(pairs[source, target]), min_path)
+
+
+
+def load_community(path = Community.path_G):
+    '''
+    Graph on disk, graph file and edges appended to log since last compaction
+    '''
+
+    G = ArtistGraph.load(path)
+    rows, offset = read_edges()
+
+    return G.add_edges(rows) if len(rows) > 0 else G
+
+
+def shortest_path_len(G, main_artist, ref_artist = Community.artist_ref_distance):
+
+    path = shortest_path(G, main_artist, ref_artist)
+
+    if len(path) == 0:
+        return Community.penalty_not_path ##penalty for not having connection
+
+    return len(path) - 1
 
-    
 
 
 def shortest_path(G, main_artist, ref_artist = Community.artist_ref_distance):
 
-    
-    return nx.shortest_path(G, source = main_artist,target = ref_artist)
+    source, target = G.resolve(main_artist), G.resolve(ref_artist)
+
+    if source is None or target is None:
+        return []
+
+    return [G.ids[item] for item in G.shortest_path(source, target)]
 
 
 
 def check_if_in_G(G, artist):
     return G.has_node(artist)
+
+
+
+community = CommunityGraph()
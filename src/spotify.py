@@ -1,8 +1,12 @@
 import datetime
-import requests
+import json
+import time
 import webbrowser
 from urllib.parse import urlencode
-from src.config import client_id,client_secret, redirect_uri
+import requests
+from src.config import client_id,client_secret, redirect_uri, spotify_api_url, spotify_accounts_url
+from src.spotify_client import client
+from src.variables import SpotifyVar
 
 import dotenv
 dotenv.load_dotenv()
@@ -17,7 +21,7 @@ def get_auth():
     '''
 
     
-    mother_link = "https://accounts.spotify.com/authorize"
+    mother_link = f"{spotify_accounts_url}/authorize"
     query_params = urlencode({"response_type": 'code',
                                 'redirect_uri': redirect_uri,
                                 'show_dialog':True,
@@ -25,7 +29,7 @@ def get_auth():
                                 "client_id": client_id})
     
     lookup_url = f"{mother_link}?{query_params}"
-    r = requests.get(lookup_url)
+    r = client.get(lookup_url)
     webbrowser.open(lookup_url, new=0)
 
     return client_id
@@ -38,13 +42,13 @@ def get_first_token(code):
     Fetches Spotify access token after code received in callback endpoint
     '''
 
-    mother_link='https://accounts.spotify.com/api/token'
+    mother_link=f'{spotify_accounts_url}/api/token'
     key={'code':code,
             "grant_type": "authorization_code",
             "client_id": client_id,"client_secret": client_secret,
             'redirect_uri':redirect_uri}
     
-    r = requests.post(mother_link,data=key)
+    r = client.post(mother_link,data=key)
     
     if r.status_code not in range(200, 299):
         raise Exception("Could not authenticate client.")
@@ -103,12 +107,12 @@ def update_token(refresh_token):
         access_token(str): new access token ready to use
         access_token_expires (datetime): time when new access token expires
     '''
-    mother_link='https://accounts.spotify.com/api/token'
+    mother_link=f'{spotify_accounts_url}/api/token'
     key={"grant_type": "refresh_token",
             "client_id": client_id,"client_secret": client_secret,
             'refresh_token':refresh_token}
 
-    r = requests.post(mother_link,data=key)  
+    r = client.post(mother_link,data=key)  
     data = r.json()
 
     now = datetime.datetime.now()
@@ -133,9 +137,9 @@ def get_my_user_info(headers):
     '''
     
 
-    endpoint = f'https://api.spotify.com/v1/me'
+    endpoint = f'{spotify_api_url}/v1/me'
     
-    r = requests.get(endpoint,headers=headers)
+    r = client.get(endpoint,headers=headers)
     
     return r.json()
 
@@ -157,12 +161,12 @@ def get_top_50(time_range, headers, limit=50):
     top_50_list = []
     
     
-    endpoint = f"https://api.spotify.com/v1/me/top/tracks"
+    endpoint = f"{spotify_api_url}/v1/me/top/tracks"
     
     query_params = urlencode({"limit": limit, 'time_range': time_range})
     lookup_url = f"{endpoint}?{query_params}"
     
-    r = requests.get(lookup_url,headers=headers)
+    r = client.get(lookup_url,headers=headers)
     
     data = r.json()
 
@@ -183,14 +187,14 @@ def _get_json_song(headers, song_id, country = None):
     Returns (json): json with song information
     """
     
-    endpoint = f'https://api.spotify.com/v1/tracks/{song_id}'
+    endpoint = f'{spotify_api_url}/v1/tracks/{song_id}'
     
 
     if country is None:
-        r = requests.get(endpoint, headers=headers)
+        r = client.get(endpoint, headers=headers)
     else:
         params = {'market':country}
-        r = requests.get(endpoint, headers=headers, params = params)
+        r = client.get(endpoint, headers=headers, params = params)
 
 
     
@@ -209,7 +213,7 @@ def create_playlist(headers, users):
 
     user_id = users[0]
 
-    endpoint = f'https://api.spotify.com/v1/users/{user_id}/playlists'
+    endpoint = f'{spotify_api_url}/v1/users/{user_id}/playlists'
     string = ' ft. '.join(users)
     headers['Content-Type'] = 'application/json'
 
@@ -217,36 +221,97 @@ def create_playlist(headers, users):
     params = {'user_id': user_id}
     data = {'name': playlist_name, 'public': False, 'collaborative': True}
 
-    r = requests.post(endpoint, headers = headers, json = data)
+    r = client.post(endpoint, headers = headers, json = data)
 
 
     return r.json()
 
+class PlaylistIncomplete(Exception):
+    '''
+    Spotify did not take all songs of a playlist. The first added songs are in it, in order
+    '''
+
+    def __init__(self, playlist_id, added, total):
+
+        super().__init__(f'{added} of {total} songs added to playlist {playlist_id}')
+        self.playlist_id = playlist_id
+        self.added = added
+        self.total = total
+
+
+
+def get_playlist_total(playlist_id, headers):
+    '''
+    Number of songs in a playlist, None if Spotify did not answer
+    '''
+
+    endpoint = f'{spotify_api_url}/v1/playlists/{playlist_id}/tracks'
+
+    r = client.get(endpoint, params = {'fields': 'total', 'limit': 1}, headers = headers)
+
+    if r.status_code not in range(200, 299):
+        return None
+
+    return r.json().get('total')
+
+
+
 def add_songs_to_playlist(playlist_id, song_id_list, headers):
     '''
-    Add songs to a specific playlist
+    Add songs to a specific playlist, after the songs already in it. Songs are sent in chunks of at most 100
+    (Spotify limit), one after another at their absolute position so order is kept. A chunk failing with a
+    server error or timeout may have been added anyway, so the playlist size is checked before sending it again
     Args:
         playlist_id (str) : specific playlist id
         song_id_list(list): list of song ids to add to playlist
-    Returns (json): json with request response
-
-
+    Returns: response of last request sent
+    Raises:
+        PlaylistIncomplete: a chunk was rejected or failed after SpotifyVar.max_playlist_retries retries
     '''
 
-    #entra lista de ids a meter de golpe
-
-    endpoint = f'https://api.spotify.com/v1/playlists/{playlist_id}/tracks' 
+    endpoint = f'{spotify_api_url}/v1/playlists/{playlist_id}/tracks' 
 
     
     headers['Content-Type'] = 'application/json'
 
     uris_list = list(map(lambda x: f'spotify:track:{x}', song_id_list))
 
-    data = {'uris': uris_list}
+    limit = SpotifyVar.max_playlist_tracks
+    chunks = [uris_list[i:i + limit] for i in range(0, len(uris_list), limit)] or [[]]
 
+    start = get_playlist_total(playlist_id, headers)
 
-    
-    r = requests.post(endpoint, json = data, headers = headers)
+    if start is None:
+        raise PlaylistIncomplete(playlist_id, 0, len(uris_list))
+
+    added = 0
+
+    for chunk in chunks:
+        position = start + added
+
+        for attempt in range(SpotifyVar.max_playlist_retries + 1):
+            try:
+                r = client.post(endpoint, json = {'uris': chunk, 'position': position}, headers = headers)
+            except (requests.ConnectionError, requests.Timeout):
+                r = None
+
+            if r is not None and r.status_code in range(200, 299):
+                break
+
+            if r is not None and r.status_code < 500: #rejected, same request would fail again
+                raise PlaylistIncomplete(playlist_id, added, len(uris_list))
+
+            total = get_playlist_total(playlist_id, headers) #failed request may have been applied
+
+            if total == position + len(chunk):
+                break
+
+            if total != position or attempt == SpotifyVar.max_playlist_retries:
+                raise PlaylistIncomplete(playlist_id, added, len(uris_list))
+
+            time.sleep(min(SpotifyVar.backoff_cap, SpotifyVar.backoff_base * 2 ** attempt))
+
+        added += len(chunk)
 
     return r
 
@@ -268,11 +333,11 @@ def get_user_top_artist(headers, limit=20, time_range = 'long_term'):
     top_list = []
     
     
-    endpoint = f"https://api.spotify.com/v1/me/top/artists"
+    endpoint = f"{spotify_api_url}/v1/me/top/artists"
     
     params = {'limit': limit, 'time_range': time_range}
     
-    r = requests.get(endpoint,headers=headers, params=params)
+    r = client.get(endpoint,headers=headers, params=params)
     
     data = r.json()['items']
 
@@ -296,12 +361,10 @@ def get_artist_related(artist_id, headers):
 
     '''
 
-    endpoint = f'https://api.spotify.com/v1/artists/{artist_id}/related-artists'
+    endpoint = f'{spotify_api_url}/v1/artists/{artist_id}/related-artists'
     
 
-    r = requests.get(endpoint,headers=headers)
-
-    return r.json()
+    return client.get_json_cached(endpoint, f'artists/{artist_id}/related-artists', 'related-artists', headers=headers)
 
 
 def get_artist_info(artist_id, headers):
@@ -317,52 +380,128 @@ def get_artist_info(artist_id, headers):
     '''
 
 
-    endpoint = f'https://api.spotify.com/v1/artists/{artist_id}'
+    endpoint = f'{spotify_api_url}/v1/artists/{artist_id}'
     
 
-    r = requests.get(endpoint,headers=headers)
-
-    return r.json()
+    return client.get_json_cached(endpoint, f'artists/{artist_id}', 'artists', headers=headers)
 
 
 def get_album_info(headers, album_id):
 
-    endpoint = f'https://api.spotify.com/v1/albums/{album_id}'
+    endpoint = f'{spotify_api_url}/v1/albums/{album_id}'
 
-    r = requests.get(endpoint,headers=headers)
+    return client.get_json_cached(endpoint, f'albums/{album_id}', 'albums', headers=headers)
 
-    return r.json()
 
+def get_several(headers, resource, ids, limit, params = None):
+    '''
+    Fetches several entities of same type with multi id endpoints, in chunks of endpoint limit.
+    Entities in metadata cache are not requested again
+    Args:
+        resource(str): 'tracks', 'artists' or 'albums'
+        ids(list): list of ids
+        limit(int): max ids per request for this endpoint
+        params(dict): extra query params, e.g. market
+    Returns:
+        data(dict): keys are requested ids, values json of each entity. Ids not found are left out
+    '''
+
+    endpoint = f'{spotify_api_url}/v1/{resource}'
 
-def check_follow(headers, user_id):
+    data = {}
+    ids = list(dict.fromkeys(ids)) #unique, keeping order
 
-    endpoint = f'https://api.spotify.com/v1/me/following/contains'
+    market = (params or {}).get('market')
+    keys = {_id: f'{resource}/{_id}' if market is None else f'{resource}/{_id}?market={market}' for _id in ids}
 
-    params = {'type': 'user', 'ids': user_id}
+    if client.cache is not None:
+        for _id in ids:
+            body, etag, fresh = client.cache.get(keys[_id])
+            if fresh:
+                data[_id] = json.loads(body)
+
+    missing = [_id for _id in ids if _id not in data]
+
+    for i in range(0, len(missing), limit):
+        chunk = missing[i:i + limit]
+
+        query_params = dict(params or {}, ids = ','.join(chunk))
+        r = client.get(endpoint, headers = headers, params = query_params)
+
+        for _id, item in zip(chunk, r.json().get(resource, [])): #same order as requested, null if not found
+            if item is not None:
+                data[_id] = item
+
+                if client.cache is not None:
+                    client.cache.set(keys[_id], resource, json.dumps(item))
+
+    return {_id: data[_id] for _id in ids if _id in data}
+
+
+def get_several_tracks(headers, song_ids, country = None):
+    '''
+    Fetches info of several songs. Returns dict keyed by song id
+    '''
+
+    params = None if country is None else {'market': country}
+
+    return get_several(headers, 'tracks', song_ids, SpotifyVar.max_tracks, params)
 
-    r = requests.get(endpoint,headers=headers, params = params)
+
+def get_several_artists(headers, artist_ids):
+    '''
+    Fetches info of several artists. Returns dict keyed by artist id
+    '''
+
+    return get_several(headers, 'artists', artist_ids, SpotifyVar.max_artists)
+
+
+def get_several_albums(headers, album_ids):
+    '''
+    Fetches info of several albums. Returns dict keyed by album id
+    '''
+
+    return get_several(headers, 'albums', album_ids, SpotifyVar.max_albums)
+
+
+def check_follow(headers, user_ids):
+    '''
+    Checks if login user follows users
+    Args:
+        user_ids(str or list): user id, or list of at most 50 user ids
+    Returns (list): True or False for every user, same order
+    '''
+
+    endpoint = f'{spotify_api_url}/v1/me/following/contains'
+
+    if not isinstance(user_ids, str):
+        user_ids = ','.join(user_ids)
+
+    params = {'type': 'user', 'ids': user_ids}
+
+    r = client.get(endpoint,headers=headers, params = params)
 
     return r.json()
 
 
 def follow_user(headers, user_id):
 
-    endpoint = f'https://api.spotify.com/v1/me/following'
+    endpoint = f'{spotify_api_url}/v1/me/following'
 
     params = {'type': 'user', 'ids': user_id}
 
-    r = requests.put(endpoint,headers=headers, params = params)
+    r = client.put(endpoint,headers=headers, params = params)
 
     return r
 
 
 def unfollow_user(headers, user_id):
 
-    endpoint = f'https://api.spotify.com/v1/me/following'
+    endpoint = f'{spotify_api_url}/v1/me/following'
 
     params = {'type': 'user', 'ids': user_id}
 
-    r = requests.delete(endpoint,headers=headers, params = params)
+    r = client.delete(endpoint,headers=headers, params = params)
 
     return r
 
@@ -415,7 +554,7 @@ class SpotifyAdmin():
               
     
     def get_auth(self):
-        mother_link = "https://accounts.spotify.com/authorize"
+        mother_link = f"{spotify_accounts_url}/authorize"
         query_params = urlencode({"client_id": self.client_id,
                                   "response_type": 'code',
                                   'redirect_uri':self.redirect_uri,
@@ -423,7 +562,7 @@ class SpotifyAdmin():
                                  'scope':'user-read-playback-state user-top-read user-modify-playback-state user-read-private playlist-modify-private playlist-modify-public'})
         
         lookup_url = f"{mother_link}?{query_params}"
-        r = requests.get(lookup_url)
+        r = client.get(lookup_url)
         webbrowser.open(lookup_url, new=1)
       
 
@@ -433,12 +572,12 @@ class SpotifyAdmin():
         return input('Please enter code from redirected url')
     
     def get_first_token(self):
-        mother_link='https://accounts.spotify.com/api/token'
+        mother_link=f'{spotify_accounts_url}/api/token'
         key={'code':self.code,
              "grant_type": "authorization_code",
              "client_id": self.client_id,"client_secret": self.client_secret,
              'redirect_uri':self.redirect_uri}
-        r = requests.post(mother_link,data=key)
+        r = client.post(mother_link,data=key)
         
         if r.status_code not in range(200, 299):
             raise Exception("Could not authenticate client.")
@@ -458,11 +597,11 @@ class SpotifyAdmin():
         return access_token    
     
     def update_token(self):
-        mother_link='https://accounts.spotify.com/api/token'
+        mother_link=f'{spotify_accounts_url}/api/token'
         key={"grant_type": "refresh_token",
              "client_id": self.client_id,"client_secret": self.client_secret,
              'refresh_token':self.refresh_token}
-        r = requests.post(mother_link,data=key)  
+        r = client.post(mother_link,data=key)  
         data = r.json()
         now = datetime.datetime.now()
         access_token = data['access_token']
@@ -502,9 +641,9 @@ class SpotifyAdmin():
         
 
     def get_resource(self, lookup_id, resource_type='albums', version='v1'):
-        endpoint = f"https://api.spotify.com/{version}/{resource_type}/{lookup_id}"
+        endpoint = f"{spotify_api_url}/{version}/{resource_type}/{lookup_id}"
         headers = self.get_resource_header()
-        r = requests.get(endpoint, headers=headers)
+        r = client.get(endpoint, headers=headers)
         if r.status_code not in range(200, 299):
             return {}
         return r.json()
@@ -517,9 +656,9 @@ class SpotifyAdmin():
     
     def base_search(self, query_params): # type
         headers = self.get_resource_header()
-        endpoint = "https://api.spotify.com/v1/search"
+        endpoint = f"{spotify_api_url}/v1/search"
         lookup_url = f"{endpoint}?{query_params}"
-        r = requests.get(lookup_url, headers=headers)
+        r = client.get(lookup_url, headers=headers)
         if r.status_code not in range(200, 299):  
             return {}
         return r.json()
@@ -543,15 +682,15 @@ class SpotifyAdmin():
     def play_song(self,song_id,offset=0,position_ms=0):
         #pending to activate one device in case none
         key={"uris": [f'spotify:track:{song_id}'],'position_ms':position_ms,'offset':{"position":offset}}
-        endpoint = f"https://api.spotify.com/v1/me/player/play"
+        endpoint = f"{spotify_api_url}/v1/me/player/play"
         headers = self.get_resource_header()
-        r = requests.put(endpoint, json=key,headers=headers)
+        r = client.put(endpoint, json=key,headers=headers)
         
         
     def get_device_ids(self):
-        endpoint = f"https://api.spotify.com/v1/me/player/devices"
+        endpoint = f"{spotify_api_url}/v1/me/player/devices"
         headers = self.get_resource_header()
-        r = requests.get(endpoint, headers=headers)
+        r = client.get(endpoint, headers=headers)
         return r.json()
 
     def random_position_song(self,length):
@@ -592,12 +731,12 @@ class SpotifyAdmin():
 
     def add_song_to_playlist_fix_genre(self,playlist_id,genre='rock'):
         
-        endpoint=f'https://api.spotify.com/v1/playlists/{playlist_id}/tracks' 
+        endpoint=f'{spotify_api_url}/v1/playlists/{playlist_id}/tracks' 
         headers = self.get_resource_header()
         song_uri=self.get_rand_song_fix_genre(genre=genre)['uri']
         key={'uris':[song_uri]}
         
-        r = requests.post(endpoint, json=key,headers=headers)
+        r = client.post(endpoint, json=key,headers=headers)
     
     
     
@@ -617,12 +756,8 @@ class SpotifyAdmin():
     
     def get_playlist_info(self,playlist_id):
         info_playlist={}
-        offset=0
-        j=0
-        while len(self.get_playlist_items(playlist_id,offset)['items'])>0:
+        for j, data_list in enumerate(self.iter_playlist_items(playlist_id)):
             print(f'Getting batch {j}')
-            data_list=self.get_playlist_items(playlist_id,offset)['items']
-            i=0
           
             for song in data_list:
                 
@@ -641,24 +776,21 @@ class SpotifyAdmin():
 
                 info_playlist[data['id']]=song_dict
                 
-                i+=1
-            offset+=i
-            j+=1
         return info_playlist
     
     def playlist_pause(self):
         headers = self.get_resource_header()
-        endpoint = f"https://api.spotify.com/v1/me/player/pause"
+        endpoint = f"{spotify_api_url}/v1/me/player/pause"
         
-        r = requests.put(endpoint,headers=headers) 
+        r = client.put(endpoint,headers=headers) 
         
         
     def check_status_playback(self):
         headers = self.get_resource_header()
-        endpoint = f"https://api.spotify.com/v1/me/player"
+        endpoint = f"{spotify_api_url}/v1/me/player"
         
         
-        r = requests.get(endpoint,headers=headers) 
+        r = client.get(endpoint,headers=headers) 
         return r.json()
     
     def get_top_50(self, time_range, limit=50):
@@ -676,12 +808,12 @@ class SpotifyAdmin():
         top_50_list = []
         
         headers = self.get_resource_header()
-        endpoint = f"https://api.spotify.com/v1/me/top/tracks"
+        endpoint = f"{spotify_api_url}/v1/me/top/tracks"
         
         query_params = urlencode({"limit": limit, 'time_range': time_range})
         lookup_url = f"{endpoint}?{query_params}"
         
-        r = requests.get(lookup_url,headers=headers)
+        r = client.get(lookup_url,headers=headers)
         
         data = r.json()
 
@@ -744,14 +876,29 @@ class SpotifyAdmin():
         return top_songs_dict
     
     
+    def iter_playlist_items(self, playlist_id, limit = 100):
+        '''
+        Yields tracks of a playlist page by page, next page is prefetched while current one is processed
+        Args:
+            playlist_id(str): playlist id
+            limit(int): tracks per page, at most 100
+        Returns:
+            generator of lists of playlist items
+        '''
+
+        endpoint = f'{spotify_api_url}/v1/playlists/{playlist_id}/tracks'
+
+        return client.paginate(endpoint, headers = self.get_resource_header, params = {'limit': limit})
+
+
     def get_playlist_items_json(self,playlist_id,offset=0):
-        endpoint=f'https://api.spotify.com/v1/playlists/{playlist_id}/tracks'
+        endpoint=f'{spotify_api_url}/v1/playlists/{playlist_id}/tracks'
         params = {"offset": offset}
         
         
         headers = self.get_resource_header()
 
-        r = requests.get(endpoint, headers = headers, params = params)
+        r = client.get(endpoint, headers = headers, params = params)
         
      
         return r.json()
@@ -769,14 +916,14 @@ class SpotifyAdmin():
         Returns (json): json with song information
         """
         
-        endpoint = f'https://api.spotify.com/v1/tracks/{song_id}'
+        endpoint = f'{spotify_api_url}/v1/tracks/{song_id}'
         headers = self.get_resource_header()
 
         if country is None:
-            r = requests.get(endpoint, headers=headers)
+            r = client.get(endpoint, headers=headers)
         else:
             params = {'market':country}
-            r = requests.get(endpoint, headers=headers, params = params)
+            r = client.get(endpoint, headers=headers, params = params)
 
 
         
@@ -788,13 +935,13 @@ class SpotifyAdmin():
     def get_artist_top_tracks_json(self, artist_id):
         
 
-        endpoint = f'https://api.spotify.com/v1/artists/{artist_id}/top-tracks'
+        endpoint = f'{spotify_api_url}/v1/artists/{artist_id}/top-tracks'
         
         headers = self.get_resource_header()
 
         params = {'country': 'ES'}
         
-        r = requests.get(endpoint, headers = headers, params = params)
+        r = client.get(endpoint, headers = headers, params = params)
 
     
         
@@ -803,18 +950,18 @@ class SpotifyAdmin():
     #for albums database
     def get_artist_albums_json(self, artist_id):
         
-        endpoint = f'https://api.spotify.com/v1/artists/{artist_id}/albums'
+        endpoint = f'{spotify_api_url}/v1/artists/{artist_id}/albums'
         headers = self.get_resource_header()
         params = {'limit': 50}
         
         
-        r = requests.get(endpoint, headers = headers, params = params)
+        r = client.get(endpoint, headers = headers, params = params)
         
         return r.json()
 
     def create_playlist(self, user_id, name1, name2):
 
-        endpoint = f'https://api.spotify.com/v1/users/{user_id}/playlists'
+        endpoint = f'{spotify_api_url}/v1/users/{user_id}/playlists'
         headers = self.get_resource_header()
         headers['Content-Type'] = 'application/json'
 
@@ -822,7 +969,7 @@ class SpotifyAdmin():
         params = {'user_id': user_id}
         data = {'name': playlist_name, 'collaborative': False}
 
-        r = requests.post(endpoint, headers = headers, json = data,)
+        r = client.post(endpoint, headers = headers, json = data,)
 
         return r.json()
 
@@ -839,65 +986,33 @@ class SpotifyAdmin():
         '''
         
 
-        endpoint = f'https://api.spotify.com/v1/me'
+        endpoint = f'{spotify_api_url}/v1/me'
         headers = self.get_resource_header()
-        r = requests.get(endpoint,headers=headers)
+        r = client.get(endpoint,headers=headers)
         
         return r.json()
 
 
     def add_song_to_playlist(self,playlist_id, song_id_list):
 
-        #entra lista de ids a meter de golpe
-
-        endpoint = f'https://api.spotify.com/v1/playlists/{playlist_id}/tracks' 
-
-        headers = self.get_resource_header()
-        headers['Content-Type'] = 'application/json'
-
-        uris_list = list(map(lambda x: f'spotify:track:{x}', song_id_list))
-
-        data = {'uris': uris_list}
-
-
-        
-        r = requests.post(endpoint, json = data, headers = headers)
-
-        return r
+        return add_songs_to_playlist(playlist_id, song_id_list, self.get_resource_header())
 
     def get_artist_related(self, artist_id):
 
-        endpoint = f'https://api.spotify.com/v1/artists/{artist_id}/related-artists'
-        headers = self.get_resource_header()
-
-        r = requests.get(endpoint,headers=headers)
-
-        return r.json()
+        return get_artist_related(artist_id, self.get_resource_header())
 
     def get_artist_info(self, artist_id):
 
-        endpoint = f'https://api.spotify.com/v1/artists/{artist_id}'
-        headers = self.get_resource_header()
-
-        r = requests.get(endpoint,headers=headers)
-
-        return r.json()
-
-    def get_album_info(self, album_id):
-
-        endpoint = f'https://api.spotify.com/v1/albums/{album_id}'
-        headers = self.get_resource_header()
-
-        r = requests.get(endpoint,headers=headers)
-
-        return r.json()
+        return get_artist_info(artist_id, self.get_resource_header())
 
+    def get_several_artists(self, artist_ids):
 
+        return get_several(self.get_resource_header(), 'artists', artist_ids, SpotifyVar.max_artists)
 
+    def get_several_albums(self, album_ids):
 
-    
-
-
+        return get_several(self.get_resource_header(), 'albums', album_ids, SpotifyVar.max_albums)
 
+    def get_album_info(self, album_id):
 
-    
+        return get_album_info(self.get_resource_header(), album_id)
@@ -0,0 +1,345 @@
+import json
+import random
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from src.variables import SpotifyVar, HttpCacheVar
+from src.http_cache import HttpCache
+
+
+
+class RateLimiter():
+    '''
+    Process wide token bucket shared by all threads doing Spotify calls.
+    A 429 response pauses every worker until Retry-After has passed
+    '''
+
+    def __init__(self, rate = SpotifyVar.rate_limit, burst = SpotifyVar.rate_burst):
+
+        self.rate = rate #tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.resume_at = 0 #no request before this time, set by 429 responses
+        self._lock = threading.Lock()
+
+        self.throttled = 0 #429 responses received
+        self.delayed = 0 #requests that had to wait
+        self.wait_time = 0.0
+
+
+    def acquire(self):
+        '''
+        Blocks until a request can be sent
+        '''
+
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if now >= self.resume_at and self.tokens >= 1:
+                    self.tokens -= 1
+                    if waited > 0:
+                        self.delayed += 1
+                        self.wait_time += waited
+                    return
+
+                delay = max(self.resume_at - now, (1 - self.tokens) / self.rate)
+
+            time.sleep(delay)
+            waited += delay
+
+
+    def pause(self, seconds):
+        '''
+        Pauses all workers after a 429 response
+        Args:
+            seconds(float): value of Retry-After header
+        '''
+
+        with self._lock:
+            self.throttled += 1
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+    def stats(self):
+
+        with self._lock:
+            return {'rate': self.rate, 'burst': self.burst, 'throttled': self.throttled,
+                    'delayed': self.delayed, 'wait_s': round(self.wait_time, 2)}
+
+
+
+class SpotifyClient():
+    '''
+    HTTP client shared by all Spotify calls. Owns a pooled session with keep alive,
+    retries timeouts, connection errors and 5xx responses of idempotent requests with exponential
+    backoff and jitter and keeps latency metrics per endpoint. Other requests, e.g. POST creating a playlist,
+    are only sent again after a 429 or if they could not connect, the server may have applied them otherwise
+    '''
+
+    idempotent = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+    def __init__(self, timeout = SpotifyVar.timeout, max_retries = SpotifyVar.max_retries,
+                backoff_base = SpotifyVar.backoff_base, backoff_cap = SpotifyVar.backoff_cap, pool_size = SpotifyVar.pool_size,
+                max_concurrency = SpotifyVar.max_concurrency, limiter = None, cache = None):
+
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.limiter = limiter or rate_limiter
+        self.cache = cache #on disk metadata cache, None to disable
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.metrics = {} #endpoint -> counters
+        self._lock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers = max_concurrency, thread_name_prefix = 'spotify')
+
+
+    def request(self, method, url, **kwargs):
+        '''
+        Sends request through rate limiter, with retries and waits for 429 responses
+        Args:
+            method(str): http method
+            url(str): full url
+            kwargs: any argument of requests, e.g. headers, params, json, data
+        Returns:
+            r: requests response
+        '''
+
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = f'{method} {endpoint_name(url)}'
+        idempotent = method.upper() in self.idempotent
+
+        attempt = 0
+        throttled = 0
+
+        while True:
+
+            self.limiter.acquire()
+
+            start = time.perf_counter()
+
+            try:
+                r = self.session.request(method, url, **kwargs)
+
+            except (requests.ConnectionError, requests.Timeout) as error:
+                self._record(endpoint, time.perf_counter() - start, attempt, error = True)
+
+                if attempt == self.max_retries or not (idempotent or never_sent(error)):
+                    raise
+
+                self._sleep_backoff(attempt)
+                attempt += 1
+                continue
+
+            self._record(endpoint, time.perf_counter() - start, attempt, error = r.status_code >= 500)
+
+            if r.status_code == 429 and throttled < SpotifyVar.max_throttled_retries:
+                self.limiter.pause(retry_after(r))
+                throttled += 1
+                continue
+
+            if r.status_code >= 500 and idempotent and attempt < self.max_retries:
+                self._sleep_backoff(attempt)
+                attempt += 1
+                continue
+
+            return r
+
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+    def get_json_cached(self, url, key, resource, **kwargs):
+        '''
+        GET request served from metadata cache if fresh. Stale entries are revalidated with their ETag
+        Args:
+            url(str): full url
+            key(str): endpoint and id, e.g. 'albums/<id>'
+            resource(str): type of resource, to pick ttl
+        Returns:
+            data(dict): json of response
+        '''
+
+        if self.cache is None:
+            return self.get(url, **kwargs).json()
+
+        body, etag, fresh = self.cache.get(key)
+
+        if fresh:
+            return json.loads(body)
+
+        if etag is not None:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'If-None-Match': etag})
+
+        r = self.get(url, **kwargs)
+
+        if r.status_code == 304 and body is not None:
+            self.cache.revalidate(key, resource)
+            return json.loads(body)
+
+        if r.status_code == 200:
+            self.cache.set(key, resource, r.text, r.headers.get('ETag'))
+
+        return r.json()
+
+
+    def gather(self, *calls):
+        '''
+        Runs independent calls concurrently, at most max_concurrency at a time.
+        Calls should not gather themselves, to not wait for workers of same pool
+        Args:
+            calls(tuple): (function, arg1, arg2...) for every call
+        Returns:
+            results(list): results in same order as calls. First exception raised is raised again
+        '''
+
+        futures = [self.executor.submit(call[0], *call[1:]) for call in calls]
+
+        return [future.result() for future in futures]
+
+
+    def paginate(self, url, headers = None, params = None, key = None):
+        '''
+        Yields items of a paged endpoint page by page, following next links. Next page is requested
+        while current one is processed and the request is dropped if consumer stops early.
+        Should not be used from calls run by gather, to not wait for workers of same pool
+        Args:
+            url(str): full url of first page
+            headers(dict or function): headers, or function returning them for long iterations
+            params(dict): query parameters of first page, next links already contain them
+            key(str): key of paging object in response if nested, e.g. 'artists' for followed artists
+        Returns:
+            generator of lists of items
+        '''
+
+        get_headers = headers if callable(headers) else (lambda: headers)
+
+        future = self.executor.submit(self._get_page, url, get_headers(), params, key)
+
+        try:
+            while future is not None:
+                page = future.result()
+
+                next_url = page.get('next')
+                future = self.executor.submit(self._get_page, next_url, get_headers(), None, key) if next_url else None #prefetch
+
+                if len(page['items']) > 0:
+                    yield page['items']
+
+        finally:
+            if future is not None:
+                future.cancel()
+
+
+    def _get_page(self, url, headers, params, key):
+
+        r = self.get(url, headers = headers, params = params)
+        r.raise_for_status()
+
+        data = r.json()
+
+        return data[key] if key is not None else data
+
+
+    def stats(self):
+        '''
+        Returns latency metrics per endpoint
+        '''
+
+        with self._lock:
+            return {endpoint: {'count': item['count'], 'errors': item['errors'], 'retries': item['retries'],
+                                'avg_ms': round(item['total_time'] / item['count'] * 1000, 1),
+                                'max_ms': round(item['max_time'] * 1000, 1)}
+                    for endpoint, item in self.metrics.items()}
+
+
+    def _sleep_backoff(self, attempt):
+
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        time.sleep(random.uniform(0, delay)) #full jitter, retries of several threads do not synchronize
+
+
+    def _record(self, endpoint, elapsed, attempt, error = False):
+
+        with self._lock:
+            item = self.metrics.setdefault(endpoint, {'count': 0, 'errors': 0, 'retries': 0, 'total_time': 0.0, 'max_time': 0.0})
+
+            item['count'] += 1
+            item['errors'] += int(error)
+            item['retries'] += int(attempt > 0)
+            item['total_time'] += elapsed
+            item['max_time'] = max(item['max_time'], elapsed)
+
+
+
+def retry_after(r):
+    '''
+    Seconds to wait given by Retry-After header of a 429 response
+    '''
+
+    try:
+        return float(r.headers.get('Retry-After', SpotifyVar.default_retry_after))
+    except ValueError:
+        return SpotifyVar.default_retry_after
+
+
+def never_sent(error):
+    '''
+    True if request failed while connecting, so server did not receive it and it can be sent again
+    '''
+
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+
+    reason = error.args[0] if len(error.args) > 0 else None
+    reason = getattr(reason, 'reason', reason) #urllib3 MaxRetryError wraps original error
+
+    return isinstance(reason, NewConnectionError)
+
+
+def endpoint_name(url):
+    '''
+    Url path with ids replaced, to group metrics by endpoint
+    '''
+
+    path = url.split('?')[0].split('://', 1)[-1]
+    path = path[path.find('/'):]
+
+    return re.sub(r'/(tracks|artists|albums|users|playlists)/[^/]+', r'/\1/{id}', path)
+
+
+
+rate_limiter = RateLimiter()
+
+client = SpotifyClient(cache = HttpCache() if HttpCacheVar.enabled else None)
@@ -0,0 +1,162 @@
+import os
+
+from sqlalchemy import create_engine, event
+
+
+
+schema = [
+    '''CREATE TABLE IF NOT EXISTS users (
+        user_id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(100),
+        country VARCHAR(10),
+        num_followers INTEGER,
+        img_url VARCHAR(300))''',
+
+    '''CREATE TABLE IF NOT EXISTS songs (
+        song_id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(100),
+        album_id VARCHAR(100),
+        is_playable INTEGER,
+        popularity INTEGER,
+        preview_url VARCHAR(300),
+        mfccs TEXT,
+        genre VARCHAR(20),
+        genre_model VARCHAR(20),
+        model_pred VARCHAR(300))''',
+
+    '''CREATE TABLE IF NOT EXISTS artist (
+        artist_id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(100),
+        popularity INTEGER,
+        followers INTEGER,
+        img_url VARCHAR(300))''',
+
+    '''CREATE TABLE IF NOT EXISTS albums (
+        album_id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(100),
+        type VARCHAR(20),
+        popularity INTEGER,
+        release_date VARCHAR(20),
+        img_url VARCHAR(300))''',
+
+    '''CREATE TABLE IF NOT EXISTS artist_rel (
+        main_id VARCHAR(100),
+        rel_id VARCHAR(100))''',
+
+    '''CREATE TABLE IF NOT EXISTS artist_song (
+        artist_id VARCHAR(100),
+        song_id VARCHAR(100))''',
+
+    '''CREATE TABLE IF NOT EXISTS artist_album (
+        artist_id VARCHAR(100),
+        album_id VARCHAR(100))''',
+
+    '''CREATE TABLE IF NOT EXISTS user_artist (
+        user_id VARCHAR(100),
+        artist_id VARCHAR(100))''',
+
+    '''CREATE TABLE IF NOT EXISTS user_song (
+        user_id VARCHAR(100),
+        song_id VARCHAR(100),
+        song_score INTEGER)''',
+
+    'CREATE INDEX IF NOT EXISTS ix_artist_name ON artist (name)',
+    'CREATE INDEX IF NOT EXISTS ix_artist_rel_main ON artist_rel (main_id)',
+    'CREATE INDEX IF NOT EXISTS ix_artist_rel_rel ON artist_rel (rel_id)',
+    'CREATE INDEX IF NOT EXISTS ix_artist_song_song ON artist_song (song_id)',
+    'CREATE INDEX IF NOT EXISTS ix_artist_song_artist ON artist_song (artist_id)',
+    'CREATE INDEX IF NOT EXISTS ix_artist_album_artist ON artist_album (artist_id)',
+    'CREATE INDEX IF NOT EXISTS ix_user_artist_user ON user_artist (user_id)',
+    'CREATE INDEX IF NOT EXISTS ix_user_song_user ON user_song (user_id)',
+]
+
+
+
+def create_sqlite_engine(path):
+    '''
+    Creates engine for embedded sqlite database in WAL mode, creating its folder and schema if needed
+    Args:
+        path(str): path to database file
+    Returns:
+        engine: sqlalchemy engine
+    '''
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+
+    engine = create_engine(f'sqlite:///{path}', connect_args = {'check_same_thread': False})
+
+    event.listen(engine, 'connect', _set_pragmas)
+
+    with engine.connect() as conn:
+        for statement in schema:
+            conn.execute(statement)
+
+    return engine
+
+
+def _set_pragmas(dbapi_conn, connection_record):
+
+    cursor = dbapi_conn.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL') #readers do not block writer
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+
+def translate_query(query):
+    '''
+    Translates mysql flavoured query to sqlite.
+    COALESCE and LIMIT n are the same in both. What differs is string literals
+    (backslash escapes and double quoted strings produced by python repr in insert_mysql)
+    and top level SELECT wrapped in parenthesis.
+    Args:
+        query(str): mysql query
+    Returns:
+        query(str): sqlite query
+    '''
+
+    query = _translate_literals(query.strip())
+
+    if query.startswith('(') and query.rstrip(';').endswith(')'):
+        query = query.rstrip(';')[1:-1] + ';'
+
+    return query
+
+
+def _translate_literals(query):
+
+    output = []
+    i = 0
+    length = len(query)
+
+    while i < length:
+        char = query[i]
+
+        if char not in ('\'', '"'):
+            output.append(char)
+            i += 1
+            continue
+
+        quote = char
+        literal = []
+        i += 1
+
+        while i < length:
+            char = query[i]
+
+            if char == '\\' and i + 1 < length: #mysql escape
+                literal.append(query[i + 1])
+                i += 2
+            elif char == quote and i + 1 < length and query[i + 1] == quote: #doubled quote
+                literal.append(quote)
+                i += 2
+            elif char == quote:
+                i += 1
+                break
+            else:
+                literal.append(char)
+                i += 1
+
+        output.append('\'' + ''.join(literal).replace('\'', '\'\'') + '\'')
+
+    return ''.join(output)
@@ -0,0 +1,241 @@
+import datetime
+import secrets
+import threading
+import time
+
+import src.spotify as spotify
+from src.variables import TokenVar
+
+
+
+class TokenMissing(Exception):
+    '''
+    No tokens for user, e.g. after a restart, in another worker or expired. User has to log in again
+    '''
+
+
+
+class TokenManager():
+    '''
+    Keeps Spotify access tokens of logged users server side, keyed by their Spotify user id. Sessions only keep
+    a random key mapped to the user id, so a cookie can not be made up from a known user id.
+    Tokens are refreshed shortly before they expire, once per user even with concurrent requests,
+    so request handlers and background jobs always get valid headers. Entries not used during
+    TokenVar.idle_ttl are evicted, unless a background job still holds them
+    '''
+
+    def __init__(self, refresh_margin = TokenVar.refresh_margin, idle_ttl = TokenVar.idle_ttl):
+
+        self.refresh_margin = datetime.timedelta(seconds = refresh_margin)
+        self.idle_ttl = idle_ttl
+
+        self._tokens = {} #user id -> {'access_token', 'access_token_expires', 'refresh_token', 'used', 'holds', 'sessions'}
+        self._sessions = {} #session key -> {'user', 'holds'}
+        self._locks = {} #user id -> lock, only one refresh in flight per user
+        self._forgotten = set() #session keys forgotten while held, dropped when released
+        self._lock = threading.Lock()
+
+        self.refreshes = 0
+        self.evictions = 0
+
+
+    def register(self, user_id, access_token, refresh_token, access_token_expires):
+        '''
+        Saves tokens received after login, replacing previous ones of user, and opens a new session for them
+        Args:
+            user_id(str): Spotify user id
+            access_token(str): access token
+            refresh_token(str): refresh token
+            access_token_expires(datetime): time when access token expires
+        Returns:
+            key(str): random key to be saved in session of user
+        '''
+
+        key = secrets.token_urlsafe(TokenVar.key_bytes)
+
+        with self._lock:
+            self._evict()
+
+            previous = self._tokens.get(user_id, {}) #other sessions and background jobs of a previous login keep running
+            self._tokens[user_id] = {'access_token': access_token, 'access_token_expires': access_token_expires, 'refresh_token': refresh_token,
+                                    'used': time.monotonic(), 'holds': previous.get('holds', 0), 'sessions': previous.get('sessions', set()) | {key}}
+            self._sessions[key] = {'user': user_id, 'holds': 0}
+            self._locks.setdefault(user_id, threading.Lock())
+
+        return key
+
+
+    def user(self, key):
+        '''
+        Gives Spotify user id of session key, or None if it is not known
+        '''
+
+        with self._lock:
+            session = self._sessions.get(key)
+
+            return session['user'] if session is not None else None
+
+
+    def headers(self, key):
+        '''
+        Generates header for any Spotify API request, refreshing access token if it is about to expire
+        Args:
+            key(str): key given by register
+        Returns:
+            headers(dict): headers for spotify api
+        Raises:
+            TokenMissing: no tokens for key, user has to log in again
+        '''
+
+        with self._lock:
+            user_id, token = self._get(key)
+
+            if token is None or self._idle(token):
+                raise TokenMissing(key)
+
+            token['used'] = time.monotonic()
+            key_lock = self._locks[user_id]
+
+        if self._expiring(token):
+            with key_lock:
+                with self._lock:
+                    token = self._tokens.get(user_id) #another request may have refreshed it while waiting
+
+                if token is None:
+                    raise TokenMissing(key)
+
+                if self._expiring(token):
+                    access_token, access_token_expires = spotify.update_token(token['refresh_token'])
+
+                    with self._lock:
+                        token['access_token'] = access_token
+                        token['access_token_expires'] = access_token_expires
+                        self.refreshes += 1
+
+        return {"Authorization": f"Bearer {token['access_token']}"}
+
+
+    def hold(self, key):
+        '''
+        Keeps session and tokens of user while a background job uses them, they are not evicted nor forgotten until released
+        Raises:
+            TokenMissing: no tokens for key
+        '''
+
+        with self._lock:
+            user_id, token = self._get(key)
+
+            if token is None:
+                raise TokenMissing(key)
+
+            token['holds'] += 1
+            self._sessions[key]['holds'] += 1
+
+
+    def release(self, key):
+
+        with self._lock:
+            user_id, token = self._get(key)
+
+            if token is None:
+                return
+
+            token['holds'] -= 1
+            token['used'] = time.monotonic()
+            self._sessions[key]['holds'] -= 1
+
+            if self._sessions[key]['holds'] == 0 and key in self._forgotten:
+                self._drop_session(key)
+
+
+    def forget(self, key):
+        '''
+        Ends session, e.g. on logout. Tokens of user are dropped with their last session. If a background job
+        holds the session, it is dropped when the job releases it
+        '''
+
+        with self._lock:
+            session = self._sessions.get(key)
+
+            if session is None:
+                return
+
+            if session['holds'] > 0:
+                self._forgotten.add(key)
+            else:
+                self._drop_session(key)
+
+
+    def stats(self):
+
+        with self._lock:
+            return {'users': len(self._tokens), 'sessions': len(self._sessions), 'held': sum(1 for token in self._tokens.values() if token['holds'] > 0),
+                    'refreshes': self.refreshes, 'evictions': self.evictions}
+
+
+    def _idle(self, token):
+
+        return token['holds'] == 0 and time.monotonic() - token['used'] > self.idle_ttl
+
+
+    def _evict(self):
+        '''
+        Drops idle entries. Called with lock held
+        '''
+
+        for key in [key for key, token in self._tokens.items() if self._idle(token)]:
+            self._drop(key)
+            self.evictions += 1
+
+
+    def _get(self, key):
+        '''
+        Gives user id and tokens of session key, None for unknown keys. Called with lock held
+        '''
+
+        session = self._sessions.get(key)
+
+        if session is None:
+            return None, None
+
+        return session['user'], self._tokens.get(session['user'])
+
+
+    def _drop(self, user_id):
+        '''
+        Drops tokens of user and all its sessions. Called with lock held
+        '''
+
+        token = self._tokens.pop(user_id, None)
+        self._locks.pop(user_id, None)
+
+        for key in (token['sessions'] if token is not None else ()):
+            self._sessions.pop(key, None)
+            self._forgotten.discard(key)
+
+
+    def _drop_session(self, key):
+        '''
+        Drops session key, and tokens of user if it was the last session and no job holds them. Called with lock held
+        '''
+
+        session = self._sessions.pop(key)
+        self._forgotten.discard(key)
+        token = self._tokens.get(session['user'])
+
+        if token is None:
+            return
+
+        token['sessions'].discard(key)
+
+        if not token['sessions'] and token['holds'] == 0:
+            self._drop(session['user'])
+
+
+    def _expiring(self, token):
+
+        return token['access_token'] is None or token['access_token_expires'] - self.refresh_margin < datetime.datetime.now()
+
+
+
+tokens = TokenManager()
@@ -54,12 +54,145 @@ class DatabaseVar():
 
     artist_album_table = 'artist_album'
 
+    pool_size = 10 #connections kept by engine, one per concurrent thread
+
+    async_workers = 8 #threads serving async database calls
+
+    batch_size = 500 #rows per multi row insert
+
+    stream_chunk_size = 1000 #rows per chunk in streaming scans
+
+    read_your_writes = 5 #seconds after a write in which reads of same user or session stay in primary and skip cache
+
+    max_tracked_writers = 10000 #users or sessions with recent writes remembered before pruning
+
+    replica_retry = 30 #seconds a failing replica is out of rotation
+
+    replica_check_interval = 10 #seconds between background health checks of replicas
+
+class CacheVar():
+
+    max_size = 4096 #max number of cached queries
+
+    ttl = 300 #seconds
+
+
+class ProfilerVar():
+
+    slowest = 5 #slowest queries kept per request
+
+    n_plus_one_threshold = 10 #repetitions of same query shape to flag N+1
+
+    history = 100 #summaries kept for metrics endpoint
+
+
+class SpotifyVar():
+
+    timeout = (3.05, 10) #seconds to connect and to read
+
+    max_retries = 3
+
+    backoff_base = 0.5 #seconds, doubled at every retry
+
+    backoff_cap = 8
+
+    pool_size = 20 #keep alive connections
+
+    max_concurrency = 8 #requests in flight from concurrent calls
+
+    rate_limit = 8 #sustained requests per second, all threads
+    rate_burst = 16
+
+    max_throttled_retries = 5 #429 responses waited before giving up
+    default_retry_after = 1 #seconds if header missing
+
+    max_tracks = 50 #ids per request in multi id endpoints
+    max_artists = 50
+    max_albums = 20
+
+    max_playlist_tracks = 100 #uris per request adding tracks to playlist
+    max_playlist_retries = 3 #retries of a chunk failing with a server error
+
+
+class FollowVar():
+
+    ttl = 300 #seconds follow state of a user is trusted
+
+    chunk_size = 50 #ids per request, Spotify limit
+
+    max_per_viewer = 2000 #users whose follow state is kept per viewer
+
+
+class TokenVar():
+
+    refresh_margin = 300 #seconds before expiry access token is refreshed
+
+    idle_ttl = 24 * 3600 #seconds tokens of a user are kept without being used
+
+    key_bytes = 32 #random bytes of session keys
+
+
+class HttpCacheVar():
+
+    enabled = True
+
+    path = './data/http_cache.db'
+
+    max_bytes = 200 * 1024 * 1024
+
+    access_batch = 200 #access times kept in memory before being written
+
+    ttl = {'artists': 7 * 24 * 3600, 'related-artists': 7 * 24 * 3600, 'albums': 30 * 24 * 3600, 'tracks': 24 * 3600} #seconds per resource
+
+    default_ttl = 24 * 3600
+
+
+class FakeSpotifyVar():
+
+    n_artists = 10000 #size of synthetic catalog
+    n_tracks = 100000
+
+    latency = (0.02, 0.1) #min and max seconds added to every response
+    rate_429 = 0.0 #share of api requests answered with 429
+    retry_after = 1
+
+    no_preview_rate = 0.1 #share of tracks with preview only in a couple of markets
+    preview_seconds = 30
+    preview_sample_rate = 22050
+
+    token_expires_in = 3600
+
+    markets = ['ES', 'US', 'SE', 'JP', 'BR', 'MX', 'GB', 'DE', 'FR', 'AU']
+    genres = ['pop', 'rock', 'hip hop', 'latin', 'edm', 'indie', 'jazz', 'classical', 'metal', 'reggaeton', 'flamenco', 'r&b']
+
+    upstream_api = 'https://api.spotify.com' #used in record mode
+    upstream_accounts = 'https://accounts.spotify.com'
+
+
+class MarketVar():
+
+    path = './data/market_hints.db'
+
+    max_parallel = 8 #markets probed at the same time
+
+    album_weight = 10 #a hit for same album counts more than a hit for same artist
+
+    dead_ttl = 30 * 24 * 3600 #seconds a song without preview is not probed again
+
+
 class Community():
 
-    path_G = './data/network/network_artists.gpickle'
+    path_G = './data/network/artist_graph.npz' #ArtistGraph, artist ids interned to indices and edges as CSR arrays
+    path_log = './data/network/artist_graph_edges.log' #edges added since last compaction, appended at every update
+    path_version = './data/network/version.txt' #version of graph on disk, increased at every update
+    path_lock = './data/network/artist_graph.lock'
+
+    version_check_interval = 1 #seconds between checks of version on disk
 
     artist_ref_distance = 'Camela'
 
+    reference_artists = ['Camela'] #distances precomputed at every graph version. Artist ids or names
+
     penalty_not_path = 15
 
 